@@ -0,0 +1,119 @@
+import os
+import math
+import time
+import threading
+
+import metrics
+
+# Endpoint class defaults: concurrent requests, requests allowed to wait, seconds a request may wait.
+# With max_concurrent 8 they need 8 + 12 + 2 + 8 = 30 threads, within the Procfile's 32
+DEFAULT_CLASSES = {
+    "chat": {"limit": 8, "queue": 12, "wait": 10.0},
+    "admin": {"limit": 2, "queue": 2, "wait": 2.0},
+    "read": {"limit": 4, "queue": 8, "wait": 2.0},
+}
+
+
+class Rejected(Exception):
+    def __init__(self, endpoint_class, status, reason, retry_after):
+        super().__init__(f"{endpoint_class} request rejected: {reason}")
+        self.endpoint_class = endpoint_class
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Class:
+    def __init__(self, name, limit, queue, wait):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.wait = wait
+        self.active = 0
+        self.waiting = 0
+
+
+class AdmissionController:
+    """
+    Per-process concurrency limits with bounded wait queues per endpoint class.
+    All classes share `max_concurrent` slots, but only chat may use the last
+    `chat_reserve` of them, so admin and read traffic can never occupy every
+    worker thread. A full queue is answered with 429 and a wait that runs out
+    with 503, both immediately and with Retry-After.
+    Waiting requests hold a worker thread, so the gunicorn thread count must be
+    at least required_threads() (max_concurrent plus every class's queue), with a
+    few to spare for unlimited endpoints; otherwise new connections queue inside
+    gunicorn instead of being shed.
+    """
+
+    def __init__(self, max_concurrent=8, chat_reserve=4, classes=None):
+        self.max_concurrent = max_concurrent
+        self.chat_reserve = chat_reserve
+        self._classes = {name: _Class(name, **config) for name, config in (classes or DEFAULT_CLASSES).items()}
+        self._active = 0
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_env(cls):
+        classes = {
+            name: {
+                "limit": int(os.environ.get(f"ADMISSION_{name.upper()}_LIMIT", config["limit"])),
+                "queue": int(os.environ.get(f"ADMISSION_{name.upper()}_QUEUE", config["queue"])),
+                "wait": float(os.environ.get(f"ADMISSION_{name.upper()}_WAIT", config["wait"])),
+            }
+            for name, config in DEFAULT_CLASSES.items()
+        }
+        return cls(
+            max_concurrent=int(os.environ.get("ADMISSION_MAX_CONCURRENT", 8)),
+            chat_reserve=int(os.environ.get("ADMISSION_CHAT_RESERVE", 4)),
+            classes=classes,
+        )
+
+    def required_threads(self):
+        return self.max_concurrent + sum(c.queue for c in self._classes.values())
+
+    def _can_enter(self, endpoint_class):
+        capacity = self.max_concurrent if endpoint_class.name == "chat" else self.max_concurrent - self.chat_reserve
+        return endpoint_class.active < endpoint_class.limit and self._active < capacity
+
+    def _publish(self, endpoint_class):
+        metrics.set_gauge(f"admission.{endpoint_class.name}.active", endpoint_class.active)
+        metrics.set_gauge(f"admission.{endpoint_class.name}.queued", endpoint_class.waiting)
+
+    def _reject(self, endpoint_class, status, reason):
+        metrics.incr(f"admission.{endpoint_class.name}.rejected.{reason}")
+        raise Rejected(endpoint_class.name, status, reason, max(1, math.ceil(endpoint_class.wait)))
+
+    def acquire(self, name):
+        """
+        Blocks until a slot of the class is free (up to its wait), or raises Rejected.
+        """
+        endpoint_class = self._classes[name]
+        start = time.time()
+        with self._condition:
+            if not self._can_enter(endpoint_class):
+                if endpoint_class.waiting >= endpoint_class.queue:
+                    self._reject(endpoint_class, 429, "queue_full")
+                endpoint_class.waiting += 1
+                self._publish(endpoint_class)
+                try:
+                    deadline = start + endpoint_class.wait
+                    while not self._can_enter(endpoint_class):
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            self._reject(endpoint_class, 503, "timeout")
+                        self._condition.wait(remaining)
+                finally:
+                    endpoint_class.waiting -= 1
+            endpoint_class.active += 1
+            self._active += 1
+            self._publish(endpoint_class)
+        metrics.observe(f"admission.{name}.wait_ms", int((time.time() - start) * 1000))
+
+    def release(self, name):
+        endpoint_class = self._classes[name]
+        with self._condition:
+            endpoint_class.active -= 1
+            self._active -= 1
+            self._publish(endpoint_class)
+            self._condition.notify_all()
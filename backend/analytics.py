@@ -0,0 +1,131 @@
+import os
+import math
+import uuid
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# Hour value of the all-time row kept next to the hourly rows of each prompt version
+TOTAL_HOUR = "1970-01-01T00:00:00+00:00"
+
+# Log-bucket sketch: quantiles are within ~2% of the true value, and sketches merge by adding counts
+SKETCH_RELATIVE_ACCURACY = 0.02
+_GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+
+def latency_bucket(value_ms):
+    return int(math.ceil(math.log(max(value_ms, 1)) / _LOG_GAMMA))
+
+
+class LatencySketch:
+    """
+    Mergeable latency sketch ({bucket index: count}); the same buckets are
+    incremented in the prompt_rollups.latency_buckets JSON column.
+    """
+
+    def __init__(self, buckets=None):
+        self.buckets = {int(k): int(v) for k, v in (buckets or {}).items()}
+
+    def add(self, value_ms):
+        index = latency_bucket(value_ms)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        return self
+
+    def quantile(self, q):
+        total = sum(self.buckets.values())
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                # Bucket midpoint (in relative terms) of (gamma^(i-1), gamma^i]
+                return round(2 * _GAMMA ** index / (_GAMMA + 1), 1)
+        return None
+
+
+def hour_start(when=None):
+    when = when or datetime.now(timezone.utc)
+    return when.replace(minute=0, second=0, microsecond=0).isoformat()
+
+
+def summarize_rollup(row):
+    """
+    Turns a prompt_rollups row into the /analytics shape.
+    """
+    sketch = LatencySketch(row.get('latency_buckets'))
+    feedback_count = row.get('feedback_count') or 0
+    similarity_count = row.get('similarity_count') or 0
+    return {
+        "requests": row.get('requests') or 0,
+        "latency_ms": {"p50": sketch.quantile(0.5), "p95": sketch.quantile(0.95), "p99": sketch.quantile(0.99)},
+        "feedback_count": feedback_count,
+        "avg_feedback": round(row['feedback_sum'] / feedback_count, 3) if feedback_count else None,
+        "similarity_count": similarity_count,
+        "avg_similarity": round(row['similarity_sum'] / similarity_count, 4) if similarity_count else None,
+    }
+
+
+class ConversationLogger:
+    """
+    Writes conversation_logs rows and the matching rollup increments off the
+    request thread. Like the shadow runner it never blocks: when too many
+    writes are pending the log is dropped and counted.
+    """
+
+    def __init__(self, insert_log_fn, update_rollup_fn, max_in_flight=64, workers=2):
+        self._insert_log = insert_log_fn
+        self._update_rollup = update_rollup_fn
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analytics")
+
+    @classmethod
+    def from_env(cls, insert_log_fn, update_rollup_fn):
+        return cls(
+            insert_log_fn,
+            update_rollup_fn,
+            max_in_flight=int(os.environ.get("ANALYTICS_MAX_IN_FLIGHT", 64)),
+            workers=int(os.environ.get("ANALYTICS_WORKERS", 2)),
+        )
+
+    def log_reply(self, client_message, bot_response, prompt_id, latency_ms, ground_truth=None, similarity=None,
+                  source="llm"):
+        """
+        Queues the log row; returns its request_id (used by /feedback), or None if dropped.
+        """
+        if not self._slots.acquire(blocking=False):
+            metrics.incr("analytics.dropped")
+            return None
+        log_id = uuid.uuid4().hex
+        row = {
+            'request_id': log_id,
+            'client_message': client_message,
+            'bot_response': bot_response,
+            'consultant_ground_truth': ground_truth,
+            'prompt_id': prompt_id,
+            'latency_ms': latency_ms,
+            'similarity': similarity,
+            'source': source,
+        }
+        self._executor.submit(self._write, row)
+        return log_id
+
+    def _write(self, row):
+        try:
+            self._insert_log(row)
+            self._update_rollup(row['prompt_id'], hour_start(), requests=1,
+                                latency_ms=row['latency_ms'], similarity=row['similarity'])
+            metrics.incr("analytics.logged")
+        except Exception as e:
+            metrics.incr("analytics.errors")
+            print(f"Conversation log write failed: {e}")
+        finally:
+            self._slots.release()
@@ -1,15 +1,38 @@
 import os
 import json
+import hashlib
 import random
 from typing import List, Dict
-from flask import Flask, request, jsonify, redirect
+from flask import Flask, request, jsonify, redirect, g
 from flask_cors import CORS
-from groq import Groq
-from supabase import create_client, Client
+from groq import BadRequestError
+from supabase import create_client, Client, ClientOptions
+import httpx
 from dotenv import load_dotenv
 
 # Import optimization logic
 from optimization import run_editor_optimization, run_manual_optimization
+from dedup import DuplicateRule
+from faq import FaqMatcher
+from shadow import ShadowRunner, summarize
+from prompting import format_history, parse_reply, build_messages
+from routing import choose_chat_tier
+from llm import chat_completion, create_client as create_llm_client
+import ratelimit
+from singleflight import SingleFlight
+import deadlines
+from deadlines import RequestContext, RequestCancelled
+from coalescing import BurstCoalescer
+from sessions import create_session_store
+import metrics
+from warmup import WarmUp, pool_limits
+from analytics import ConversationLogger, LatencySketch, latency_bucket, summarize_rollup, hour_start, TOTAL_HOUR
+from similarity import text_similarity
+from semantic_cache import SemanticCache
+from exemplars import ExemplarIndex
+from client_state import ClientStateTracker, llm_extract_state
+from admission import AdmissionController, Rejected
+from datetime import datetime, timezone, timedelta
 
 # Load environment variables
 load_dotenv()
@@ -17,6 +40,60 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app) # Enable CORS for all routes
 
+# Endpoints whose LLM calls queue behind live chat for the shared Groq quota
+ADMIN_ENDPOINTS = {'improve_ai', 'improve_ai_manually'}
+
+# Admission control classes; endpoints not listed (health, readiness, metrics) are never limited
+ENDPOINT_CLASSES = {
+    'generate_reply': 'chat', 'chat': 'chat', 'create_session': 'chat',
+    'session_message': 'chat', 'session_reply': 'chat',
+    'improve_ai': 'admin', 'improve_ai_manually': 'admin', 'shadow_promote': 'admin',
+    'get_prompt': 'read', 'list_prompt_versions': 'read', 'get_prompt_version': 'read',
+    'get_session': 'read', 'feedback': 'read', 'get_analytics': 'read', 'shadow_status': 'read',
+}
+admission = AdmissionController.from_env() if os.environ.get("ADMISSION_CONTROL", "1") == "1" else None
+if admission:
+    print(f"Admission control: needs at least {admission.required_threads()} worker threads")
+
+@app.before_request
+def admit_request():
+    # Runs first so shed requests cost nothing; chat keeps reserved slots during training bursts
+    endpoint_class = ENDPOINT_CLASSES.get(request.endpoint)
+    if admission is None or endpoint_class is None or request.method == 'OPTIONS':
+        return None
+    try:
+        admission.acquire(endpoint_class)
+    except Rejected as e:
+        response = jsonify({"error": "Server busy, please retry", "reason": e.reason})
+        response.status_code = e.status
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    g.admission_class = endpoint_class
+
+@app.before_request
+def start_request_context():
+    # Deadline (X-Request-Deadline / X-Request-Timeout) and disconnect watch for LLM calls
+    g.request_context_token = deadlines.activate(RequestContext.from_request(request))
+    g.priority_token = ratelimit.set_priority("admin" if request.endpoint in ADMIN_ENDPOINTS else "chat")
+
+@app.teardown_request
+def end_request_context(exc):
+    token = g.pop('request_context_token', None)
+    if token is not None:
+        deadlines.deactivate(token)
+    token = g.pop('priority_token', None)
+    if token is not None:
+        ratelimit.reset_priority(token)
+    endpoint_class = g.pop('admission_class', None)
+    if endpoint_class is not None:
+        admission.release(endpoint_class)
+
+@app.errorhandler(RequestCancelled)
+def request_cancelled(e):
+    metrics.incr(f"requests.cancelled.{e.reason}")
+    # 499 (client closed request) is never read; 504 tells proxies the deadline passed
+    return jsonify({"error": str(e)}), 504 if e.reason == "deadline" else 499
+
 @app.route('/')
 def index():
     return redirect('/health')
@@ -25,16 +102,35 @@ def index():
 def health():
     return jsonify({"status": "DTV Chatbot is running"})
 
+@app.route('/ready')
+def ready():
+    # Readiness probe: passes only once the warm-up (connection pools, active prompt) has finished
+    status = warm_up.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+@app.route('/metrics')
+def get_metrics():
+    snapshot = metrics.snapshot()
+    snapshot["faq_hit_rate"] = metrics.ratio("faq.hits", "faq.misses")
+    snapshot["semantic_cache_hit_rate"] = metrics.ratio("semantic_cache.hits", "semantic_cache.misses")
+    audits = metrics.get_counter("semantic_cache.audits")
+    snapshot["semantic_cache_false_hit_rate"] = round(metrics.get_counter("semantic_cache.false_hits") / audits, 4) if audits else None
+    prompt_tokens = metrics.get_counter("llm.prompt_tokens")
+    snapshot["prompt_cache_hit_rate"] = round(metrics.get_counter("llm.cached_tokens") / prompt_tokens, 4) if prompt_tokens else None
+    routed = metrics.get_counter("router.requests")
+    snapshot["router_escalation_rate"] = round(metrics.get_counter("router.escalations") / routed, 4) if routed else None
+    return jsonify(snapshot)
+
 
 # Initialize Groq client
-client = Groq(
-    api_key=os.environ.get("GROQ_API_KEY"),
-)
+client = create_llm_client()
 
 # Initialize Supabase client
 url: str = os.environ.get("SUPABASE_URL")
 key: str = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
+supabase: Client = create_client(url, key, options=ClientOptions(
+    httpx_client=httpx.Client(limits=pool_limits(), timeout=120)
+))
 
 # Configuration
 INITIAL_SYSTEM_PROMPT = """# Immigration Consultant Chatbot - System Prompt
@@ -150,7 +246,7 @@ Given a client's message(s) and the preceding chat history, generate an appropri
 ### Reapplications After Rejection
 - Different pricing (20,000-24,000 THB depending on rejection reason)
 - May not have money-back guarantee
-- Reason for thorough review of previous rejection reasons
+- Require thorough review of previous rejection reasons
 - Need to strengthen documentation
 
 ### Common Concerns
@@ -188,100 +284,252 @@ current_system_prompt = INITIAL_SYSTEM_PROMPT
 
 import time
 
-def get_latest_prompt():
+INITIAL_PROMPT_RECORD = {'id': None, 'prompt_text': INITIAL_SYSTEM_PROMPT}
+
+# Concurrent prompt refreshes (e.g. right after a prompt change) collapse into one Supabase query
+prompt_flight = SingleFlight("prompt")
+
+def get_latest_prompt_record():
+    """
+    Returns the active prompt row ({'id', 'prompt_text', ...}).
+    Falls back to the built-in prompt (id None) if the DB is empty or unreachable.
+    """
+    return prompt_flight.do('active', fetch_latest_prompt_record)
+
+def fetch_latest_prompt_record():
     attempts = 3
     for i in range(attempts):
         try:
             response = supabase.table('prompts').select('*').eq('is_active', True).order('created_at', desc=True).limit(1).execute()
             if response.data:
-                return response.data[0]['prompt_text']
-            return INITIAL_SYSTEM_PROMPT
+                return response.data[0]
+            return INITIAL_PROMPT_RECORD
         except Exception as e:
             if i < attempts - 1:
                 print(f"Attempt {i+1} failed to fetch prompt, retrying... ({e})")
                 time.sleep(1) # Wait 1 second before retry
             else:
                 print(f"Error fetching prompt after {attempts} attempts: {e}")
-    return INITIAL_SYSTEM_PROMPT
+    return INITIAL_PROMPT_RECORD
 
-# Initialize prompt on startup
-current_system_prompt = get_latest_prompt()
+def get_latest_prompt():
+    return get_latest_prompt_record()['prompt_text']
 
-def format_history(history_data):
+def get_candidate_prompt_record():
     """
-    Formats history (list of dicts or strings) into Groq-compatible messages.
-    User format: [{"role": "consultant", "message": "..."}]
-    Groq format: [{"role": "assistant", "content": "..."}]
+    Returns the newest candidate prompt under shadow evaluation, or None.
     """
-    formatted_messages = []
-    if not isinstance(history_data, list):
-        return formatted_messages
-
-    for msg in history_data:
-        if isinstance(msg, dict):
-            role = msg.get('role', 'user')
-            content = msg.get('message', msg.get('content', ''))
-            
-            # Map role names
-            if role == 'consultant':
-                role = 'assistant'
-            elif role == 'client':
-                role = 'user'
-            
-            formatted_messages.append({"role": role, "content": content})
-        elif isinstance(msg, str):
-            # Fallback for raw strings if any
-            formatted_messages.append({"role": "user", "content": msg})
-            
-    return formatted_messages
-
-def generate_reply_logic(client_sequence, history):
-    # Ensure we have the latest prompt
-    prompt = get_latest_prompt()
-    
-    messages = [{"role": "system", "content": prompt}]
-    
-    # Add history
-    messages.extend(format_history(history))
-    
-    # Add current message
-    messages.append({"role": "user", "content": client_sequence})
-
-    # CRITICAL: Ensure "json" is in messages for Groq API compliance
-    messages.append({"role": "system", "content": "IMPORTANT: You must respond in JSON format."})
-
-    completion = client.chat.completions.create(
-        model=os.environ.get("MODEL_NAME", "llama-3.1-8b-instant"), 
-        messages=messages,
-        temperature=0.7,
-        max_tokens=500, 
-        response_format={"type": "json_object"}
-    )
+    response = supabase.table('prompts').select('id, prompt_text').eq('is_candidate', True).order('created_at', desc=True).limit(1).execute()
+    return response.data[0] if response.data else None
+
+def publish_prompt(new_prompt, version_notes):
+    """
+    Stores a new prompt version. In shadow mode it becomes the candidate
+    (evaluated on live traffic, promoted via /shadow/promote); otherwise it goes live.
+    """
+    if SHADOW_MODE:
+        supabase.table('prompts').update({'is_candidate': False}).eq('is_candidate', True).execute()
+        supabase.table('prompts').insert({
+            'prompt_text': new_prompt,
+            'is_active': False,
+            'is_candidate': True,
+            'version_notes': version_notes
+        }).execute()
+        shadow_runner.invalidate()
+        return
+
+    supabase.table('prompts').update({'is_active': False}).eq('is_active', True).execute()
+    supabase.table('prompts').insert({
+        'prompt_text': new_prompt,
+        'is_active': True,
+        'version_notes': version_notes
+    }).execute()
+
+def get_prompt_to_improve():
+    """
+    In shadow mode new rules build on the pending candidate, so consecutive
+    improvements accumulate instead of replacing each other.
+    """
+    if SHADOW_MODE:
+        candidate = get_candidate_prompt_record()
+        if candidate:
+            return candidate['prompt_text']
+    return get_latest_prompt()
+
+def store_shadow_result(row):
+    supabase.table('shadow_results').insert(row).execute()
+
+
+# Shadow evaluation: new prompt versions become candidates scored on replayed live traffic
+SHADOW_MODE = os.environ.get("SHADOW_MODE", "0") == "1"
+SHADOW_MARGIN = float(os.environ.get("SHADOW_MARGIN", 0.02))
+SHADOW_MIN_SAMPLES = int(os.environ.get("SHADOW_MIN_SAMPLES", 20))
+shadow_runner = ShadowRunner.from_env(
+    lambda client_sequence, history, prompt, contact_id, ground_truth: generate_reply_logic(
+        client_sequence, history, prompt=prompt, exclude_contact=contact_id, ground_truth=ground_truth),
+    get_candidate_prompt_record,
+    store_shadow_result,
+)
+
+# Conversation-keyed debounce for bursts of client messages (COALESCE_WINDOW_MS=0 disables)
+burst_coalescer = BurstCoalescer.from_env()
+
+# Server-side conversation history (SESSION_STORE=memory|sqlite)
+session_store = create_session_store()
+
+def insert_conversation_log(row):
+    supabase.table('conversation_logs').insert(row).execute()
+
+def update_prompt_rollup(prompt_id, hour, requests=0, latency_ms=None, feedback=None, similarity=None):
+    # One atomic RPC increments both the hourly and the all-time rollup row
+    supabase.rpc('record_prompt_rollup', {
+        'p_prompt_id': prompt_id,
+        'p_hour': hour,
+        'p_requests': requests,
+        'p_latency_bucket': latency_bucket(latency_ms) if latency_ms is not None else None,
+        'p_feedback': feedback,
+        'p_similarity': similarity,
+    }).execute()
+
+# Per-prompt-version analytics: conversation_logs rows + incremental rollups (ANALYTICS_ENABLED=0 disables)
+conversation_logger = ConversationLogger.from_env(insert_conversation_log, update_prompt_rollup) if os.environ.get("ANALYTICS_ENABLED", "1") == "1" else None
+
+# Instant FAQ fast path (set FAQ_FAST_PATH=0 to always call the LLM)
+faq_matcher = FaqMatcher.from_env() if os.environ.get("FAQ_FAST_PATH", "1") == "1" else None
+
+# Few-shot examples from real consultant replies (built offline by scripts/build_exemplar_index.py)
+exemplar_index = ExemplarIndex.from_env()
+
+# Long conversations: structured client state + the last few raw turns instead of the full history
+client_state_tracker = ClientStateTracker.from_env(llm_fallback=llm_extract_state(client, chat_completion)) if os.environ.get("CLIENT_STATE", "1") == "1" else None
+
+# Paraphrase-tolerant reply cache scoped to the active prompt version (SEMANTIC_CACHE=0 disables)
+semantic_cache = SemanticCache.from_env() if os.environ.get("SEMANTIC_CACHE", "1") == "1" else None
+
+def warm_supabase():
+    supabase.table('prompts').select('id').limit(1).execute()
+
+def warm_groq():
+    # Any authenticated request opens the TLS connection that later completions reuse
+    if os.environ.get("LLM_CASSETTE_MODE", "off") != "replay":
+        client.models.list()
+
+def warm_prompt():
+    global current_system_prompt
+    record = fetch_latest_prompt_record()
+    if record is INITIAL_PROMPT_RECORD:
+        # Either no prompt is stored yet or Supabase failed; only the latter should block readiness
+        supabase.table('prompts').select('id').limit(1).execute()
+    current_system_prompt = record['prompt_text']
+
+def warm_completion():
+    # Tiny completion with the real static prompt core, priming the provider's prefix cache too
+    with ratelimit.priority("batch"):
+        chat_completion(client, build_messages(current_system_prompt, [], "Hi"), tier="small", max_tokens=1)
+
+# Startup warm-up; /ready reports 503 until every step has succeeded
+WARMUP_STEPS = [("supabase", warm_supabase), ("groq", warm_groq), ("prompt", warm_prompt)]
+if os.environ.get("WARMUP_PRIME_COMPLETION", "0") == "1":
+    WARMUP_STEPS.append(("completion", warm_completion))
+warm_up = WarmUp(WARMUP_STEPS, retry_interval=float(os.environ.get("WARMUP_RETRY_SECONDS", 5)))
+warm_up.start()
+
+def generate_reply_logic(client_sequence, history, prompt=None, formatted_history=None,
+                         exclude_contact=None, ground_truth=None):
+    # Ensure we have the latest prompt (callers may pass a specific version, e.g. shadow evaluation)
+    if prompt is None:
+        prompt = get_latest_prompt()
     
-    response_content = completion.choices[0].message.content.strip()
+    # Static prompt core first, then rules + JSON instruction, then the nearest real consultant
+    # exchanges and the client state of long conversations, then history (sessions pass their
+    # already formatted messages; long ones are cut to the last few turns) and the current message.
+    # Training passes the sample's contact and real reply so they're never retrieved as exemplars.
+    if formatted_history is None:
+        formatted_history = format_history(history)
+    exemplars = None
+    if exemplar_index:
+        exemplars = exemplar_index.nearest(client_sequence, history, exclude_contact=exclude_contact, exclude_reply=ground_truth)
+    state_block = None
+    if client_state_tracker:
+        state_block, formatted_history = client_state_tracker.compact(history, formatted_history)
+    messages = build_messages(prompt, formatted_history, client_sequence, exemplars=exemplars, client_state=state_block)
+
+    # Cascade: cheap features pick the tier, invalid output from the small model escalates
+    tier, reason = choose_chat_tier(client_sequence, history)
+    metrics.incr("router.requests")
+    metrics.incr(f"router.routed.{tier}.{reason}")
+
     try:
-        # Attempt to parse as JSON
-        json_response = json.loads(response_content)
-        
-        # Priority 1: Check for "reply" (Our standard)
-        if "reply" in json_response:
-            return str(json_response["reply"])
-            
-        # Priority 2: Check for other common keys that Groq might hallucinate
-        for key in ["response", "aiReply", "message", "text", "content"]:
-            if key in json_response:
-                return str(json_response[key])
-        
-        # Priority 3: If it's a flat dict with values, it might be the data itself
-        # but we really want the string. If it's just one key, return it.
-        if len(json_response) == 1:
-            return str(list(json_response.values())[0])
-            
-        # Fallback: Stringify the whole object if we can't find a clear message
-        return json.dumps(json_response, indent=2)
-    except:
-        # Fallback for plain text or malformed JSON
-        return response_content
+        completion = chat_completion(
+            client,
+            messages,
+            tier=tier,
+            temperature=0.7,
+            max_tokens=500, 
+            response_format={"type": "json_object"}
+        )
+        ai_reply, valid = parse_reply(completion.choices[0].message.content.strip())
+    except BadRequestError:
+        # Groq rejects generations that fail JSON validation
+        if tier == "large":
+            raise
+        ai_reply, valid = None, False
+
+    if not valid and tier != "large":
+        metrics.incr("router.escalations")
+        completion = chat_completion(
+            client,
+            messages,
+            tier="large",
+            temperature=0.7,
+            max_tokens=500,
+            response_format={"type": "json_object"}
+        )
+        ai_reply, valid = parse_reply(completion.choices[0].message.content.strip())
+
+    return ai_reply
+
+def serve_reply(client_sequence, history, formatted_history=None):
+    """
+    Answers a client message: FAQ fast path first, then the semantic cache, then the LLM (with shadow replay).
+    Returns the JSON body for the reply endpoints.
+    """
+    # Fast path: approved template answers for common questions, no LLM call
+    if faq_matcher:
+        faq_reply = faq_matcher.answer(client_sequence, history)
+        if faq_reply:
+            return {"aiReply": faq_reply, "source": "faq", "promptVersion": None}
+
+    prompt_record = get_latest_prompt_record()
+    if semantic_cache:
+        lookup_start = time.time()
+        cached = semantic_cache.lookup(client_sequence, history, prompt_record['id'])
+        if cached:
+            cached_reply, index, _ = cached
+            audit_history = list(formatted_history) if formatted_history is not None else None
+            def regenerate():
+                with ratelimit.priority("batch"):
+                    return generate_reply_logic(client_sequence, history, prompt=prompt_record['prompt_text'], formatted_history=audit_history)
+            semantic_cache.submit_audit(index, cached_reply, regenerate)
+            response = {"aiReply": cached_reply, "source": "cache", "promptVersion": prompt_record['id']}
+            # Cache hits are replies under this prompt version too: count them in the rollups and let them be rated
+            if conversation_logger:
+                response["logId"] = conversation_logger.log_reply(
+                    client_sequence, cached_reply, prompt_record['id'], int((time.time() - lookup_start) * 1000), source="cache"
+                )
+            return response
+
+    start = time.time()
+    ai_reply = generate_reply_logic(client_sequence, history, prompt=prompt_record['prompt_text'], formatted_history=formatted_history)
+    latency_ms = int((time.time() - start) * 1000)
+    if semantic_cache:
+        semantic_cache.add(client_sequence, history, prompt_record['id'], ai_reply)
+    if SHADOW_MODE:
+        shadow_runner.submit(client_sequence, history, ai_reply, prompt_record['id'], primary_latency_ms=latency_ms)
+    response = {"aiReply": ai_reply, "source": "llm", "promptVersion": prompt_record['id']}
+    if conversation_logger:
+        response["logId"] = conversation_logger.log_reply(client_sequence, ai_reply, prompt_record['id'], latency_ms)
+    return response
 
 @app.route('/generate-reply', methods=['POST'])
 def generate_reply():
@@ -289,25 +537,141 @@ def generate_reply():
     Request:
     {
       "clientSequence": "...",
-      "chatHistory": [ { "role": "consultant", "message": "..." } ]
+      "chatHistory": [ { "role": "consultant", "message": "..." } ],
+      "conversationId": "..."  (optional, enables burst coalescing)
     }
     Response:
     {
-      "aiReply": "..."
+      "aiReply": "...",
+      "source": "llm" | "faq" | "cache",
+      "promptVersion": 42  (prompt id that produced the reply; null for FAQ answers)
+    }
+    Superseded by a newer message of the same burst:
+    {
+      "aiReply": null,
+      "superseded": true
     }
     """
     data = request.json
     client_sequence = data.get('clientSequence')
     history = data.get('chatHistory', [])
+    conversation_id = data.get('conversationId')
     
     if not client_sequence:
         return jsonify({"error": "clientSequence is required"}), 400
 
+    # Merge messages sent in quick succession into one clientSequence
+    batch = None
+    if conversation_id and burst_coalescer.window > 0:
+        batch = burst_coalescer.submit(conversation_id, client_sequence, history, deadlines.current())
+        if batch is None:
+            return jsonify({"aiReply": None, "superseded": True})
+        client_sequence, history = batch.client_sequence, batch.history
+
+    try:
+        response = serve_reply(client_sequence, history)
+        if batch:
+            response["mergedMessages"] = batch.count
+        return jsonify(response)
+    except RequestCancelled as e:
+        if e.reason != "superseded":
+            raise
+        # A newer message arrived mid-generation; it will answer the whole burst
+        batch = None
+        return jsonify({"aiReply": None, "superseded": True})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if batch:
+            burst_coalescer.finish(batch)
+
+@app.route('/sessions', methods=['POST'])
+def create_session():
+    """
+    Request (optional, seeds an existing conversation):
+    {
+      "chatHistory": [ { "role": "consultant", "message": "..." } ]
+    }
+    Response:
+    {
+      "sessionId": "...",
+      "expiresIn": 3600
+    }
+    """
+    data = request.get_json(silent=True) or {}
+    session = session_store.create(data.get('chatHistory', []))
+    return jsonify({"sessionId": session.id, "expiresIn": session_store.ttl}), 201
+
+@app.route('/sessions/<session_id>', methods=['GET'])
+def get_session(session_id):
+    session = session_store.get(session_id)
+    if session is None:
+        return jsonify({"error": "Session not found or expired"}), 404
+    return jsonify({"sessionId": session.id, "chatHistory": session.history})
+
+@app.route('/sessions/<session_id>/messages', methods=['POST'])
+def session_message(session_id):
+    """
+    Request:
+    {
+      "clientSequence": "...",
+      "coalesce": true  (optional, merge bursts like conversationId on /generate-reply)
+    }
+    Response: same as /generate-reply. The history is kept server-side;
+    post the reply actually sent to /sessions/<id>/reply.
+    """
+    data = request.json
+    client_sequence = data.get('clientSequence')
+    if not client_sequence:
+        return jsonify({"error": "clientSequence is required"}), 400
+
+    session = session_store.get(session_id)
+    if session is None:
+        return jsonify({"error": "Session not found or expired"}), 404
+
+    # Bursts within a session are merged just like conversationId requests
+    batch = None
+    if data.get('coalesce') and burst_coalescer.window > 0:
+        batch = burst_coalescer.submit(session_id, client_sequence, None, deadlines.current())
+        if batch is None:
+            return jsonify({"aiReply": None, "superseded": True})
+        client_sequence = batch.client_sequence
+
     try:
-        ai_reply = generate_reply_logic(client_sequence, history)
-        return jsonify({"aiReply": ai_reply})
+        response = serve_reply(client_sequence, session.history, formatted_history=session.formatted)
+        session_store.add_turn(session_id, 'client', client_sequence)
+        if batch:
+            response["mergedMessages"] = batch.count
+        return jsonify(response)
+    except RequestCancelled as e:
+        if e.reason != "superseded":
+            raise
+        batch = None
+        return jsonify({"aiReply": None, "superseded": True})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    finally:
+        if batch:
+            burst_coalescer.finish(batch)
+
+@app.route('/sessions/<session_id>/reply', methods=['POST'])
+def session_reply(session_id):
+    """
+    Records the consultant reply that was actually sent (AI or edited).
+    Request:
+    {
+      "consultantReply": "..."
+    }
+    """
+    data = request.json
+    consultant_reply = data.get('consultantReply')
+    if not consultant_reply:
+        return jsonify({"error": "consultantReply is required"}), 400
+
+    session = session_store.add_turn(session_id, 'consultant', consultant_reply)
+    if session is None:
+        return jsonify({"error": "Session not found or expired"}), 404
+    return jsonify({"sessionId": session.id, "turns": len(session.history)})
 
 @app.route('/improve-ai', methods=['POST'])
 def improve_ai():
@@ -321,7 +685,8 @@ def improve_ai():
     {
       "clientSequence": "...",
       "chatHistory": [...],
-      "consultantReply": "..."
+      "consultantReply": "...",
+      "contactId": "..."  (optional, excludes that conversation from the few-shot exemplars)
     }
     Response:
     {
@@ -333,13 +698,27 @@ def improve_ai():
     client_sequence = data.get('clientSequence')
     history = data.get('chatHistory', [])
     consultant_reply = data.get('consultantReply')
+    contact_id = data.get('contactId')
     
     if not client_sequence or not consultant_reply:
          return jsonify({"error": "clientSequence and consultantReply are required"}), 400
     
     try:
         # 1. Get current prediction
-        predicted_reply = generate_reply_logic(client_sequence, history)
+        prompt_record = get_latest_prompt_record()
+        start = time.time()
+        predicted_reply = generate_reply_logic(client_sequence, history, prompt=prompt_record['prompt_text'],
+                                               exclude_contact=contact_id, ground_truth=consultant_reply)
+        if conversation_logger:
+            conversation_logger.log_reply(
+                client_sequence, predicted_reply, prompt_record['id'], int((time.time() - start) * 1000),
+                ground_truth=consultant_reply, similarity=text_similarity(predicted_reply, consultant_reply)
+            )
+
+        # Ground-truth samples are the most valuable shadow comparisons
+        if SHADOW_MODE:
+            shadow_runner.submit(client_sequence, history, predicted_reply, prompt_record['id'],
+                                 ground_truth=consultant_reply, contact_id=contact_id)
         
         # 2. Run Optimization
         # Prepare sample data
@@ -349,19 +728,20 @@ def improve_ai():
             'consultant_response': consultant_reply
         }
         
-        current_prompt = get_latest_prompt()
-        new_prompt = run_editor_optimization(client, current_prompt, sample_data, predicted_reply)
+        current_prompt = get_prompt_to_improve()
+        try:
+            new_prompt = run_editor_optimization(client, current_prompt, sample_data, predicted_reply)
+        except DuplicateRule as e:
+            # Nothing new learned: keep the current version instead of writing a paraphrase
+            return jsonify({
+                "predictedReply": predicted_reply,
+                "updatedPrompt": current_prompt,
+                "duplicateOf": e.existing
+            })
         
         # 3. Update Database
         if new_prompt and len(new_prompt) > 20:
-             supabase.table('prompts').update({'is_active': False}).eq('is_active', True).execute()
-             
-             data_insert = {
-                'prompt_text': new_prompt,
-                'is_active': True,
-                'version_notes': f"Auto-improved based on: {client_sequence[:20]}..."
-             }
-             supabase.table('prompts').insert(data_insert).execute()
+             publish_prompt(new_prompt, f"Auto-improved based on: {client_sequence[:20]}...")
              
              return jsonify({
                  "predictedReply": predicted_reply,
@@ -370,6 +750,8 @@ def improve_ai():
         else:
              return jsonify({"error": "Optimization failed to generate a valid prompt"}), 500
 
+    except RequestCancelled:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -383,32 +765,36 @@ def improve_ai_manually():
     """
     Request:
     {
-      "instructions": "..."
+      "instructions": "...",
+      "allowDuplicate": false   // optional, skips the near-duplicate rule check
     }
     Response:
     {
       "updatedPrompt": "..."
     }
+    409 with "duplicateOf" if the rule near-duplicates an existing one.
     """
     data = request.json
     instructions = data.get('instructions')
+    allow_duplicate = data.get('allowDuplicate') is True
     
     if not instructions:
         return jsonify({"error": "instructions are required"}), 400
         
     try:
-        current_prompt = get_latest_prompt()
-        new_prompt = run_manual_optimization(client, current_prompt, instructions)
+        current_prompt = get_prompt_to_improve()
+        try:
+            new_prompt = run_manual_optimization(client, current_prompt, instructions, check_duplicates=not allow_duplicate)
+        except DuplicateRule as e:
+            # The admin asked for this rule explicitly: say so instead of dropping it quietly
+            return jsonify({
+                "error": "Rule duplicates an existing one; resend with allowDuplicate to add it anyway",
+                "updatedPrompt": current_prompt,
+                "duplicateOf": e.existing
+            }), 409
         
         if new_prompt and len(new_prompt) > 20:
-             supabase.table('prompts').update({'is_active': False}).eq('is_active', True).execute()
-             
-             data_insert = {
-                'prompt_text': new_prompt,
-                'is_active': True,
-                'version_notes': f"Manual update: {instructions[:20]}..."
-             }
-             supabase.table('prompts').insert(data_insert).execute()
+             publish_prompt(new_prompt, f"Manual update: {instructions[:20]}...")
              
              return jsonify({
                  "updatedPrompt": new_prompt
@@ -416,6 +802,8 @@ def improve_ai_manually():
         else:
             return jsonify({"error": "Failed to generate prompt"}), 500
 
+    except RequestCancelled:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -429,12 +817,146 @@ def chat():
     try:
         reply = generate_reply_logic(client_sequence, history)
         return jsonify({"response": reply})
+    except RequestCancelled:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
         
+def prompt_etag(prompt_text):
+    return hashlib.sha256(prompt_text.encode('utf-8')).hexdigest()[:20]
+
 @app.route('/prompt', methods=['GET'])
 def get_prompt():
-    return jsonify({"system_prompt": get_latest_prompt()})
+    # Pollers send If-None-Match and get a 304 while the active prompt is unchanged
+    record = get_latest_prompt_record()
+    response = jsonify({"system_prompt": record['prompt_text'], "promptVersion": record['id']})
+    response.set_etag(prompt_etag(record['prompt_text']))
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/prompt/versions', methods=['GET'])
+def list_prompt_versions():
+    """
+    Newest first, without the prompt text. Query: ?limit=20&before=<id> (pass nextBefore for the next page).
+    """
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    before = request.args.get('before', type=int)
+    query = supabase.table('prompts').select('id, created_at, is_active, is_candidate, version_notes').order('id', desc=True).limit(limit + 1)
+    if before is not None:
+        query = query.lt('id', before)
+    rows = query.execute().data
+    return jsonify({
+        "versions": rows[:limit],
+        "nextBefore": rows[limit - 1]['id'] if len(rows) > limit else None
+    })
+
+@app.route('/prompt/versions/<int:version_id>', methods=['GET'])
+def get_prompt_version(version_id):
+    rows = supabase.table('prompts').select('*').eq('id', version_id).limit(1).execute().data
+    if not rows:
+        return jsonify({"error": "Prompt version not found"}), 404
+    response = jsonify(rows[0])
+    # The text of a version never changes but its active/candidate flags do, so the ETag covers the whole row
+    response.set_etag(prompt_etag(json.dumps(rows[0], sort_keys=True, default=str)))
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/feedback', methods=['POST'])
+def feedback():
+    """
+    Request:
+    {
+      "logId": "...",  (from a reply response)
+      "score": 1-5,
+      "text": "..."  (optional)
+    }
+    A reply can be rated once; a second rating for the same logId gets 409.
+    """
+    data = request.json
+    log_id = data.get('logId')
+    score = data.get('score')
+    if not log_id or not isinstance(score, int) or isinstance(score, bool) or not 1 <= score <= 5:
+        return jsonify({"error": "logId and an integer score from 1 to 5 are required"}), 400
+
+    try:
+        # Only rows without a score are updated, so a resubmission can't be counted in the rollups twice
+        rows = supabase.table('conversation_logs').update({
+            'feedback_score': score,
+            'feedback_text': data.get('text')
+        }).eq('request_id', log_id).is_('feedback_score', 'null').execute().data
+        if not rows:
+            existing = supabase.table('conversation_logs').select('request_id').eq('request_id', log_id).limit(1).execute().data
+            if existing:
+                return jsonify({"error": "Feedback was already recorded for this logId"}), 409
+            return jsonify({"error": "Unknown logId"}), 404
+
+        # Credit the feedback to the hour the reply was served in
+        created_at = datetime.fromisoformat(rows[0]['created_at'])
+        update_prompt_rollup(rows[0]['prompt_id'], hour_start(created_at), feedback=score)
+        return jsonify({"status": "recorded"})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/analytics', methods=['GET'])
+def get_analytics():
+    """
+    Per prompt version: request count, latency percentiles, average feedback and
+    similarity to ground truth, read from the precomputed rollups.
+    Query: ?promptId=<id>&hours=24 adds that version's hourly series.
+    """
+    totals = supabase.table('prompt_rollups').select('*').eq('hour', TOTAL_HOUR).order('prompt_id', desc=True).execute().data
+    response = {"prompts": [{"promptId": row['prompt_id'], **summarize_rollup(row)} for row in totals]}
+
+    prompt_id = request.args.get('promptId', type=int)
+    if prompt_id is not None:
+        hours = min(request.args.get('hours', 24, type=int), 24 * 31)
+        since = hour_start(datetime.now(timezone.utc) - timedelta(hours=hours))
+        rows = supabase.table('prompt_rollups').select('*').eq('prompt_id', prompt_id).gte('hour', since).order('hour').execute().data
+        response["hourly"] = [{"hour": row['hour'], **summarize_rollup(row)} for row in rows]
+        # Window totals merge the hourly sketches instead of rescanning logs
+        merged = LatencySketch()
+        for row in rows:
+            merged.merge(LatencySketch(row.get('latency_buckets')))
+        response["window"] = {
+            "hours": hours,
+            "requests": sum(row['requests'] for row in rows),
+            "latency_ms": {"p50": merged.quantile(0.5), "p95": merged.quantile(0.95), "p99": merged.quantile(0.99)},
+        }
+    return jsonify(response)
+
+@app.route('/shadow/status', methods=['GET'])
+def shadow_status():
+    candidate = get_candidate_prompt_record()
+    if not candidate:
+        return jsonify({"shadowMode": SHADOW_MODE, "candidate": None})
+
+    rows = supabase.table('shadow_results').select('agreement, primary_score, shadow_score').eq('candidate_prompt_id', candidate['id']).execute().data
+    return jsonify({
+        "shadowMode": SHADOW_MODE,
+        "candidate": candidate['id'],
+        "summary": summarize(rows, margin=SHADOW_MARGIN, min_samples=SHADOW_MIN_SAMPLES)
+    })
+
+@app.route('/shadow/promote', methods=['POST'])
+def shadow_promote():
+    # Simple security check
+    admin_secret = os.environ.get("ADMIN_SECRET")
+    if admin_secret and request.headers.get("X-Admin-Key") != admin_secret:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    candidate = get_candidate_prompt_record()
+    if not candidate:
+        return jsonify({"error": "No candidate prompt"}), 404
+
+    rows = supabase.table('shadow_results').select('agreement, primary_score, shadow_score').eq('candidate_prompt_id', candidate['id']).execute().data
+    summary = summarize(rows, margin=SHADOW_MARGIN, min_samples=SHADOW_MIN_SAMPLES)
+    if not summary["non_inferior"]:
+        return jsonify({"error": "Candidate is not yet shown to be non-inferior", "summary": summary}), 409
+
+    supabase.table('prompts').update({'is_active': False}).eq('is_active', True).execute()
+    supabase.table('prompts').update({'is_active': True, 'is_candidate': False}).eq('id', candidate['id']).execute()
+    shadow_runner.invalidate()
+    return jsonify({"promoted": candidate['id'], "summary": summary})
 
 if __name__ == '__main__':
     # Use PORT from environment variable (Railway/Heroku/etc. standard)
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+import httpx
+
+MODES = ("off", "record", "replay")
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'llm_cassette.sqlite3')
+
+# Response headers that differ on every call and would only bloat the cassette
+_VOLATILE_HEADERS = {"date", "x-request-id", "set-cookie", "cf-ray", "via", "alt-svc", "content-length"}
+
+
+def request_key(request):
+    """
+    Method + path + canonical JSON body. Headers (API key, SDK version, retry count) are ignored.
+    """
+    body = request.content or b""
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode('utf-8')
+    except ValueError:
+        pass
+    digest = hashlib.sha256()
+    digest.update(request.method.encode('utf-8'))
+    digest.update(request.url.raw_path)
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class Cassette:
+    """
+    SQLite file of recorded responses, indexed by request key. Bodies are kept as
+    the raw chunks received (still content-encoded) together with their arrival
+    offsets, so streaming responses replay chunk by chunk.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS interactions (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                chunks BLOB NOT NULL,
+                chunk_sizes TEXT NOT NULL,
+                chunk_offsets_ms TEXT NOT NULL,
+                latency_ms INTEGER NOT NULL,
+                recorded_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def save(self, key, url, status, headers, chunks, offsets_ms, latency_ms):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO interactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, status, json.dumps(headers), b"".join(chunks),
+                 json.dumps([len(c) for c in chunks]), json.dumps(offsets_ms), latency_ms, time.time())
+            )
+            self._conn.commit()
+
+    def load(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, headers, chunks, chunk_sizes, chunk_offsets_ms, latency_ms FROM interactions WHERE key = ?",
+                (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, headers, blob, sizes, offsets, latency_ms = row
+        chunks, position = [], 0
+        for size in json.loads(sizes):
+            chunks.append(blob[position:position + size])
+            position += size
+        return {"status": status, "headers": json.loads(headers), "chunks": chunks,
+                "offsets_ms": json.loads(offsets), "latency_ms": latency_ms}
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    def __init__(self, response, started, on_complete):
+        self._response = response
+        self._started = started
+        self._on_complete = on_complete
+
+    def __iter__(self):
+        chunks, offsets = [], []
+        for chunk in self._response.stream:
+            chunks.append(chunk)
+            offsets.append(int((time.perf_counter() - self._started) * 1000))
+            yield chunk
+        self._on_complete(chunks, offsets)
+
+    def close(self):
+        self._response.close()
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, chunks, offsets_ms, latency_ms, latency_scale):
+        self._chunks = chunks
+        self._offsets_ms = offsets_ms
+        self._latency_ms = latency_ms
+        self._scale = latency_scale
+
+    def __iter__(self):
+        previous = self._latency_ms
+        for chunk, offset in zip(self._chunks, self._offsets_ms):
+            if self._scale:
+                time.sleep(max(0, offset - previous) * self._scale / 1000)
+            previous = offset
+            yield chunk
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """
+    httpx transport that records real responses (mode "record") or serves them
+    from the cassette without touching the network (mode "replay"). In replay,
+    latency_scale=1.0 reproduces the recorded timing and 0 returns immediately.
+    """
+
+    def __init__(self, mode, path=DEFAULT_PATH, latency_scale=0.0, inner=None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.cassette = Cassette(path)
+        self._inner = (inner or httpx.HTTPTransport()) if mode == "record" else None
+
+    @classmethod
+    def from_env(cls):
+        """
+        Returns a transport for LLM_CASSETTE_MODE=record|replay, or None when it is off.
+        """
+        mode = os.environ.get("LLM_CASSETTE_MODE", "off")
+        if mode not in MODES:
+            raise ValueError(f"LLM_CASSETTE_MODE must be one of {', '.join(MODES)}")
+        if mode == "off":
+            return None
+        return cls(
+            mode,
+            path=os.environ.get("LLM_CASSETTE_PATH", DEFAULT_PATH),
+            latency_scale=float(os.environ.get("LLM_CASSETTE_LATENCY", 0)),
+        )
+
+    def handle_request(self, request):
+        key = request_key(request)
+        if self.mode == "replay":
+            return self._replay(request, key)
+
+        started = time.perf_counter()
+        response = self._inner.handle_request(request)
+        latency_ms = int((time.perf_counter() - started) * 1000)
+        headers = [(k, v) for k, v in response.headers.items() if k.lower() not in _VOLATILE_HEADERS]
+
+        def on_complete(chunks, offsets_ms):
+            self.cassette.save(key, str(request.url), response.status_code, headers, chunks, offsets_ms, latency_ms)
+
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(response, started, on_complete),
+            extensions=response.extensions,
+        )
+
+    def _replay(self, request, key):
+        entry = self.cassette.load(key)
+        if entry is None:
+            # A 404 is not retried by the SDK, so a miss fails fast with a clear message
+            return httpx.Response(404, json={"error": {
+                "message": f"No cassette entry for {request.method} {request.url.path} (key {key[:12]})",
+                "type": "cassette_miss",
+            }})
+        if self.latency_scale:
+            time.sleep(entry["latency_ms"] * self.latency_scale / 1000)
+        return httpx.Response(
+            entry["status"],
+            headers=entry["headers"],
+            stream=_ReplayStream(entry["chunks"], entry["offsets_ms"], entry["latency_ms"], self.latency_scale),
+        )
+
+    def close(self):
+        if self._inner is not None:
+            self._inner.close()
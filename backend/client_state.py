@@ -0,0 +1,278 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+import metrics
+
+FIELDS = ("nationality", "current_location", "submission_country", "visa_category",
+          "stage", "urgency", "previous_rejection")
+
+_PLACES = {
+    "singapore": "Singapore", "laos": "Laos", "vientiane": "Laos", "indonesia": "Indonesia",
+    "bali": "Indonesia", "jakarta": "Indonesia", "malaysia": "Malaysia", "kuala lumpur": "Malaysia",
+    "kl": "Malaysia", "penang": "Malaysia", "vietnam": "Vietnam", "hanoi": "Vietnam",
+    "ho chi minh": "Vietnam", "cambodia": "Cambodia", "phnom penh": "Cambodia", "taiwan": "Taiwan",
+    "japan": "Japan", "tokyo": "Japan", "korea": "South Korea", "seoul": "South Korea",
+    "hong kong": "Hong Kong", "philippines": "Philippines", "manila": "Philippines",
+    "uk": "United Kingdom", "london": "United Kingdom", "usa": "United States", "us": "United States",
+    "australia": "Australia", "sydney": "Australia", "germany": "Germany", "thailand": "Thailand",
+    "bangkok": "Thailand", "chiang mai": "Thailand", "phuket": "Thailand",
+}
+_NATIONALITIES = {
+    "american": "United States", "british": "United Kingdom", "english": "United Kingdom",
+    "australian": "Australia", "canadian": "Canada", "german": "Germany", "french": "France",
+    "dutch": "Netherlands", "italian": "Italy", "spanish": "Spain", "swedish": "Sweden",
+    "singaporean": "Singapore", "malaysian": "Malaysia", "indonesian": "Indonesia",
+    "vietnamese": "Vietnam", "filipino": "Philippines", "japanese": "Japan", "korean": "South Korea",
+    "chinese": "China", "indian": "India", "russian": "Russia", "irish": "Ireland",
+    "new zealander": "New Zealand", "kiwi": "New Zealand", "south african": "South Africa",
+}
+_PLACE = "(" + "|".join(sorted((re.escape(p) for p in _PLACES), key=len, reverse=True)) + ")"
+_NATIONALITY = "(" + "|".join(sorted((re.escape(n) for n in _NATIONALITIES), key=len, reverse=True)) + ")"
+
+_NATIONALITY_PATTERNS = [
+    re.compile(rf"\bi(?:'m| am) (?:an? )?{_NATIONALITY}\b"),
+    re.compile(rf"\b{_NATIONALITY} (?:citizen|passport|national)\b"),
+    re.compile(rf"\b(?:i'm|i am|we're|we are) from {_PLACE}\b"),
+    re.compile(rf"\b(?:my )?passport is (?:from )?{_PLACE}\b"),
+]
+_LOCATION_PATTERNS = [
+    re.compile(rf"\b(?:currently|now|right now|living|staying|based) (?:in|at) {_PLACE}\b"),
+    re.compile(rf"\bi(?:'m| am) (?:currently |now )?in {_PLACE}\b"),
+]
+_SUBMISSION_PATTERNS = [
+    re.compile(rf"\b(?:apply|applying|submit|submitting|application) (?:from|in|at|via|through) (?:the )?(?:thai embassy in )?{_PLACE}\b"),
+    re.compile(rf"\bembassy in {_PLACE}\b"),
+]
+_SUBMISSION_HERE = re.compile(r"\b(?:apply|applying|submit|submitting) (?:from )?here\b")
+_CATEGORIES = [
+    ("remote work", re.compile(r"\b(remote(?:ly)?|digital nomad|freelanc|self-employed|workcation|work for an? \w+ company)")),
+    ("soft power: muay thai", re.compile(r"\bmuay thai\b")),
+    ("soft power: cooking class", re.compile(r"\b(thai )?cooking (class|school|course)")),
+    ("soft power", re.compile(r"\b(soft power|yoga|language course|thai language|festival)\b")),
+    ("medical", re.compile(r"\b(medical treatment|hospital|surgery)\b")),
+    ("dependent", re.compile(r"\b(dependent|spouse|my (wife|husband|partner|kids|children))\b")),
+]
+_URGENT = re.compile(r"\b(urgent(ly)?|asap|as soon as possible|deadline|running out of time|visa expires|flight (is )?(on|next))\b")
+# Only the client's own past rejection counts: not hypotheticals ("what if I'm rejected?") or third parties
+_REJECTED = [
+    re.compile(r"\b(?:i|we)(?:'ve| have)? (?:was|were|been|got|get|had) (?:\w+ )?(?:rejected|refused|denied)\b"),
+    re.compile(r"\bmy (?:previous |last |first |earlier |dtv |thai )?(?:visa|application|dtv)(?: application)? "
+               r"(?:was|got|has been|had been) (?:\w+ )?(?:rejected|refused|denied)\b"),
+    re.compile(r"\b(?:i|we) (?:had|have had|got|received) an? (?:previous |earlier )?(?:visa )?(?:rejection|refusal|denial)\b"),
+]
+_CLAUSE_SPLIT = re.compile(r"[,;]|\b(?:but|so|and)\b")
+_INTERROGATIVE = re.compile(
+    r"^\s*(?:what|how|when|where|which|who|why|can|could|may|should|would|will|do|does|did|is|are|am|if|in case)\b"
+)
+# Consultant phrasing that marks progress through the application, latest wins
+_STAGES = [
+    ("approved", re.compile(r"\b(congratulations|has been approved|visa (is|was) approved)\b")),
+    ("submitted", re.compile(r"\b(submitted your application|application (has been|was) submitted|embassy is (now )?reviewing)\b")),
+    ("documents", re.compile(r"\b(upload|review your documents|documents? (look|are) (good|complete))\b")),
+]
+
+
+def _turn(turn):
+    """
+    (role, text) of a history entry: a {"role", "message"} dict or a "Client: ..." string.
+    """
+    if isinstance(turn, dict):
+        role = turn.get('role', 'user')
+        return ('client' if role in ('client', 'user') else 'consultant'), turn.get('message', turn.get('content', '')) or ''
+    text = str(turn)
+    if text.startswith("Consultant: "):
+        return 'consultant', text[12:]
+    if text.startswith("Client: "):
+        return 'client', text[8:]
+    return 'client', text
+
+
+def _first(patterns, text, table):
+    for pattern in patterns:
+        match = pattern.search(text)
+        if match:
+            return table[match.group(1)]
+    return None
+
+
+def _statements(text):
+    """
+    The text without its questions: question sentences keep only the clauses
+    that don't ask anything ("I'm in Bali, can I apply here?" keeps "I'm in Bali").
+    """
+    kept = []
+    for sentence in re.findall(r"[^.!?\n]+[.!?]*", text):
+        if not sentence.strip().endswith("?"):
+            kept.append(sentence)
+            continue
+        kept.extend(clause for clause in _CLAUSE_SPLIT.split(sentence.rstrip("?")) if not _INTERROGATIVE.match(clause))
+    return " . ".join(kept)
+
+
+def update_state(state, role, text):
+    """
+    Returns the state after one more turn. Cheap regex extractors only; later
+    mentions overwrite earlier ones. Facts are only taken from statements, never from questions.
+    """
+    state = dict(state)
+    lowered = text.lower()
+    if role == 'client':
+        facts = _statements(lowered)
+        for pattern in _NATIONALITY_PATTERNS:
+            match = pattern.search(facts)
+            if match:
+                value = match.group(1)
+                state['nationality'] = _NATIONALITIES.get(value) or _PLACES.get(value)
+                break
+        state['current_location'] = _first(_LOCATION_PATTERNS, facts, _PLACES) or state.get('current_location')
+        submission = _first(_SUBMISSION_PATTERNS, facts, _PLACES)
+        if submission is None and _SUBMISSION_HERE.search(facts):
+            submission = state.get('current_location') or state.get('nationality')
+        state['submission_country'] = submission or state.get('submission_country')
+        for category, pattern in _CATEGORIES:
+            if pattern.search(lowered):
+                state['visa_category'] = category
+                break
+        if _URGENT.search(lowered):
+            state['urgency'] = True
+        if any(pattern.search(facts) for pattern in _REJECTED):
+            state['previous_rejection'] = True
+            state['stage'] = 'rejected'
+    else:
+        for stage, pattern in _STAGES:
+            if pattern.search(lowered):
+                state['stage'] = stage
+                break
+    return state
+
+
+def format_state(state):
+    """
+    Compact system-message block of the known fields.
+    """
+    lines = [f"- {field.replace('_', ' ')}: {'yes' if value is True else value}"
+             for field, value in ((f, state.get(f)) for f in FIELDS) if value]
+    if not lines:
+        return None
+    return "Known client details from earlier in this conversation (older messages are omitted):\n" + "\n".join(lines)
+
+
+class ClientStateTracker:
+    """
+    Structured state per conversation, updated turn by turn. States are cached
+    by a rolling hash of the conversation prefix, so each request only runs the
+    extractors on turns added since the last one, for sessions and for clients
+    resending their full chatHistory alike.
+    """
+
+    def __init__(self, keep_turns=6, max_entries=5000, llm_fallback=None):
+        self.keep_turns = keep_turns
+        self.max_entries = max_entries
+        self._llm_fallback = llm_fallback
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, llm_fallback=None):
+        return cls(
+            keep_turns=int(os.environ.get("CLIENT_STATE_KEEP_TURNS", 6)),
+            max_entries=int(os.environ.get("CLIENT_STATE_MAX_ENTRIES", 5000)),
+            llm_fallback=llm_fallback if os.environ.get("CLIENT_STATE_LLM_FALLBACK", "0") == "1" else None,
+        )
+
+    def _get(self, key):
+        with self._lock:
+            state = self._states.get(key)
+            if state is not None:
+                self._states.move_to_end(key)
+            return state
+
+    def _put(self, key, state):
+        with self._lock:
+            self._states[key] = state
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_entries:
+                self._states.popitem(last=False)
+
+    def state_for(self, history):
+        turns = [_turn(t) for t in history]
+        prefix_hashes = []
+        digest = b""
+        for role, text in turns:
+            digest = hashlib.sha256(digest + role.encode('utf-8') + b"\0" + text.encode('utf-8')).digest()
+            prefix_hashes.append(digest)
+
+        # Resume from the longest prefix we already have a state for
+        state, start = {}, 0
+        for i in range(len(turns) - 1, -1, -1):
+            cached = self._get(prefix_hashes[i])
+            if cached is not None:
+                state, start = cached, i + 1
+                break
+        metrics.observe("client_state.turns_extracted", len(turns) - start)
+
+        for i in range(start, len(turns)):
+            state = update_state(state, *turns[i])
+        if start < len(turns):
+            state = self._fill_missing(state, turns)
+            self._put(prefix_hashes[-1], state)
+        return state
+
+    def _fill_missing(self, state, turns):
+        # Optional LLM pass, only when raw turns are about to be dropped and fields are still unknown
+        if not self._llm_fallback or len(turns) <= self.keep_turns:
+            return state
+        missing = [f for f in FIELDS if state.get(f) is None]
+        if not missing:
+            return state
+        try:
+            extracted = self._llm_fallback(turns[:-self.keep_turns], missing)
+            metrics.incr("client_state.llm_fallbacks")
+        except Exception as e:
+            metrics.incr("client_state.llm_fallback_errors")
+            print(f"Client state LLM fallback failed: {e}")
+            return state
+        state = dict(state)
+        for field in missing:
+            if extracted.get(field) not in (None, "", "unknown"):
+                state[field] = extracted[field]
+        return state
+
+    def compact(self, history, formatted_history):
+        """
+        Returns (state_block, formatted_tail). Short conversations are passed through unchanged.
+        """
+        if len(history) <= self.keep_turns or len(formatted_history) != len(history):
+            return None, formatted_history
+        block = format_state(self.state_for(history))
+        metrics.incr("client_state.compacted")
+        metrics.observe("client_state.dropped_turns", len(history) - self.keep_turns)
+        return block, formatted_history[-self.keep_turns:]
+
+
+def llm_extract_state(client, chat_completion):
+    """
+    LLM fallback for ClientStateTracker: asks the small model for the missing fields as JSON.
+    """
+    def extract(turns, missing):
+        transcript = "\n".join(f"{role.capitalize()}: {text}" for role, text in turns)
+        completion = chat_completion(
+            client,
+            [
+                {"role": "system", "content": (
+                    "Extract facts about the visa client from the conversation. Respond in JSON with exactly "
+                    f"these keys: {', '.join(missing)}. Use null for anything not stated."
+                )},
+                {"role": "user", "content": transcript},
+            ],
+            tier="small",
+            temperature=0,
+            max_tokens=150,
+            response_format={"type": "json_object"},
+        )
+        return json.loads(completion.choices[0].message.content)
+    return extract
@@ -0,0 +1,108 @@
+import os
+import time
+import threading
+
+import metrics
+
+
+class _Burst:
+    def __init__(self, history):
+        self.messages = []
+        self.history = history
+        self.latest_history = history
+        self.seq = 0
+        self.context = None
+
+
+class Batch:
+    """
+    The merged messages one request is responsible for answering.
+    """
+
+    def __init__(self, key, burst, context):
+        self.key = key
+        self.burst = burst
+        self.seq = burst.seq
+        self.count = len(burst.messages)
+        self.client_sequence = "\n".join(burst.messages)
+        self.history = burst.history
+        self.context = context
+
+
+class BurstCoalescer:
+    """
+    Conversation-keyed debounce window, mirroring how parse_conversations merges
+    consecutive client messages into one client_sequence.
+
+    Each message waits for `window` seconds of quiet. A newer message for the same
+    conversation supersedes the waiting requests and cancels a generation already
+    in flight, so only the last request of a burst answers, with all its messages.
+    State lives in this process: run gunicorn with threads so a burst lands in one worker.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._cond = threading.Condition()
+        self._bursts = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(float(os.environ.get("COALESCE_WINDOW_MS", 1500)) / 1000.0)
+
+    def submit(self, key, message, history, context=None):
+        """
+        Blocks for the quiet period. Returns a Batch to answer, or None if a newer
+        message superseded this one.
+        """
+        with self._cond:
+            burst = self._bursts.get(key)
+            if burst is None:
+                # History is taken from the first message of the burst: later requests
+                # may already include the earlier, still unanswered messages
+                burst = _Burst(history)
+                self._bursts[key] = burst
+            burst.messages.append(message)
+            burst.latest_history = history
+            burst.seq += 1
+            my_seq = burst.seq
+            if burst.context is not None:
+                burst.context.cancel("superseded")
+                burst.context = None
+                metrics.incr("coalesce.cancelled_generations")
+            self._cond.notify_all()
+            metrics.set_gauge("coalesce.open_bursts", len(self._bursts))
+
+            quiet_until = time.time() + self.window
+            while burst.seq == my_seq:
+                remaining = quiet_until - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            if burst.seq != my_seq:
+                metrics.incr("coalesce.superseded")
+                return None
+
+            burst.context = context
+            metrics.incr("coalesce.batches")
+            metrics.observe("coalesce.batch_size", len(burst.messages))
+            return Batch(key, burst, context)
+
+    def finish(self, batch):
+        """
+        Drops the messages a batch answered. Not called for superseded batches,
+        whose messages roll into the next reply.
+        """
+        with self._cond:
+            burst = self._bursts.get(batch.key)
+            if burst is not batch.burst:
+                return
+            if burst.context is batch.context:
+                burst.context = None
+            if burst.seq == batch.seq:
+                del self._bursts[batch.key]
+            else:
+                # A message arrived after the reply was generated: it starts a new burst
+                del burst.messages[:batch.count]
+                burst.history = burst.latest_history
+            metrics.set_gauge("coalesce.open_bursts", len(self._bursts))
@@ -0,0 +1,171 @@
+import os
+import time
+import select
+import socket
+import threading
+import contextvars
+
+import metrics
+
+_current = contextvars.ContextVar("request_context", default=None)
+
+# Abandoned helper threads still running, per run_cancellable name
+_abandoned = {}
+_abandoned_lock = threading.Lock()
+
+
+class RequestCancelled(Exception):
+    """
+    Raised when a request's deadline passes or its client goes away.
+    `reason` is "deadline" or "disconnect".
+    """
+
+    def __init__(self, reason):
+        super().__init__(f"Request cancelled ({reason})")
+        self.reason = reason
+
+
+def client_disconnected(environ):
+    """
+    Best-effort check whether the client closed its connection.
+    The request body has already been read, so a readable socket that returns
+    EOF on peek means the peer hung up. Unknown servers/TLS sockets report False.
+    """
+    sock = environ.get('gunicorn.socket') or environ.get('werkzeug.socket')
+    if sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        return sock.recv(1, socket.MSG_PEEK) == b''
+    except ValueError:
+        return False
+    except OSError:
+        return True
+
+
+def deadline_from_headers(headers, now=None):
+    """
+    Absolute deadline (epoch seconds) from X-Request-Deadline (epoch seconds or
+    milliseconds) or X-Request-Timeout (seconds), else REQUEST_TIMEOUT_SECONDS.
+    Returns None when there is no deadline.
+    """
+    now = now or time.time()
+    try:
+        if headers.get('X-Request-Deadline'):
+            deadline = float(headers['X-Request-Deadline'])
+            return deadline / 1000.0 if deadline > 1e12 else deadline
+        if headers.get('X-Request-Timeout'):
+            return now + float(headers['X-Request-Timeout'])
+    except ValueError:
+        pass
+    default_timeout = float(os.environ.get("REQUEST_TIMEOUT_SECONDS", 0))
+    return now + default_timeout if default_timeout > 0 else None
+
+
+class RequestContext:
+    """
+    Per-request cancellation state shared with the LLM call layer.
+    """
+
+    def __init__(self, deadline=None, is_disconnected=None):
+        self.deadline = deadline
+        self._is_disconnected = is_disconnected
+        self._cancelled = threading.Event()
+        self.reason = None
+
+    @classmethod
+    def from_request(cls, request):
+        environ = request.environ
+        return cls(deadline_from_headers(request.headers), lambda: client_disconnected(environ))
+
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.time())
+
+    def cancel(self, reason):
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self._cancelled.set()
+
+    def check(self):
+        """
+        Raises RequestCancelled if the request was cancelled, timed out or abandoned.
+        """
+        if not self._cancelled.is_set():
+            if self.deadline is not None and time.time() >= self.deadline:
+                self.cancel("deadline")
+            elif self._is_disconnected and self._is_disconnected():
+                self.cancel("disconnect")
+        if self._cancelled.is_set():
+            raise RequestCancelled(self.reason)
+
+
+def activate(context):
+    return _current.set(context)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+def _track_abandoned(name, delta):
+    with _abandoned_lock:
+        _abandoned[name] = _abandoned.get(name, 0) + delta
+        metrics.set_gauge(f"{name}.abandoned_in_flight", _abandoned[name])
+
+
+def run_cancellable(fn, context, poll_interval=0.05, on_cancel=None, name="cancellable"):
+    """
+    Runs fn() on a helper thread while the calling (request) thread watches the
+    deadline and the client connection. On cancellation the request thread is
+    released immediately and on_cancel() is called to stop the work (e.g. close
+    the HTTP response); fn must also pass a bounded timeout of its own.
+    Helper threads still running after cancellation are counted in the
+    <name>.abandoned counter and the <name>.abandoned_in_flight gauge.
+    """
+    context.check()
+    result = {}
+    state = {"done": False, "abandoned": False}
+    state_lock = threading.Lock()
+    done = threading.Event()
+
+    def target():
+        try:
+            result['value'] = fn()
+        except BaseException as e:
+            result['error'] = e
+        finally:
+            with state_lock:
+                state['done'] = True
+                if state['abandoned']:
+                    _track_abandoned(name, -1)
+            done.set()
+
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(target,), daemon=True)
+    thread.start()
+    while not done.wait(poll_interval):
+        try:
+            context.check()
+        except RequestCancelled:
+            with state_lock:
+                if not state['done']:
+                    state['abandoned'] = True
+                    _track_abandoned(name, 1)
+                    metrics.incr(f"{name}.abandoned")
+            if on_cancel is not None:
+                try:
+                    on_cancel()
+                except Exception as e:
+                    print(f"Cancelling {name} call failed: {e}")
+            raise
+
+    if 'error' in result:
+        raise result['error']
+    return result['value']
@@ -0,0 +1,168 @@
+import re
+import random
+import hashlib
+import threading
+
+import metrics
+from prompting import split_prompt
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "with", "is", "are", "be",
+    "it", "its", "they", "them", "their", "that", "this", "if", "when", "as", "at", "by",
+    "always", "only", "explicitly", "clearly", "please", "should", "must", "user", "users",
+    "client", "clients", "ai", "you", "your",
+}
+# Rules that name different places or numbers state different facts, however similar the wording
+_PLACES = re.compile(
+    r"\b(singapore|laos|vientiane|indonesia|bali|jakarta|malaysia|kuala lumpur|kl|penang|vietnam|hanoi|"
+    r"ho chi minh|cambodia|phnom penh|taiwan|japan|tokyo|korea|seoul|hong kong|philippines|manila|china|"
+    r"india|uk|united kingdom|london|usa|united states|australia|germany|france|canada|thailand|"
+    r"bangkok|chiang mai|phuket|myanmar|europe|schengen)\b"
+)
+_NUMBERS = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+class DuplicateRule(Exception):
+    """
+    Raised when a generated rule is a near-duplicate of one already in the prompt.
+    """
+
+    def __init__(self, rule, existing):
+        super().__init__(f"Rule duplicates an existing one: {existing}")
+        self.rule = rule
+        self.existing = existing
+
+
+def _stem(word):
+    for suffix in ("ing", "ed", "es", "s"):
+        if len(word) > len(suffix) + 2 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+
+def rule_tokens(rule):
+    """
+    Normalised content words of a rule; paraphrases share most of them.
+    """
+    return {_stem(w) for w in _WORD.findall(rule.lower()) if w not in _STOPWORDS}
+
+
+def anchor_tokens(rule):
+    """
+    Places and numbers in a rule; two rules are only compared when these match exactly.
+    """
+    lowered = rule.lower()
+    return frozenset(_PLACES.findall(lowered)) | frozenset(_NUMBERS.findall(lowered))
+
+
+def extract_rules(prompt_text):
+    """
+    The "- ..." lines appended below the Scenario Improvements heading.
+    """
+    _, rules = split_prompt(prompt_text)
+    return [line[2:].strip() for line in rules.splitlines() if line.startswith("- ") and line[2:].strip()]
+
+
+class MinHasher:
+    def __init__(self, num_perm=64, seed=1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._params = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(num_perm)]
+
+    def signature(self, tokens):
+        hashes = [int.from_bytes(hashlib.blake2b(t.encode('utf-8'), digest_size=8).digest(), 'big') for t in tokens]
+        if not hashes:
+            return (0,) * self.num_perm
+        return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self._params)
+
+
+class RuleIndex:
+    """
+    MinHash/LSH index over the learned rules of one prompt version. Lookups only
+    compare against rules sharing an LSH band, so they don't grow with the rule count.
+    With 16 bands of 4 rows, pairs above ~0.5 Jaccard almost always become candidates;
+    `threshold` is then checked on the estimated similarity, and only against
+    rules that mention the same places and numbers.
+    """
+
+    def __init__(self, threshold=0.6, num_perm=64, bands=16):
+        self.threshold = threshold
+        self.bands = bands
+        self._rows = num_perm // bands
+        self._hasher = MinHasher(num_perm)
+        self._buckets = {}
+        self._signatures = []
+        self._anchors = []
+        self.rules = []
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self._rows:(band + 1) * self._rows]
+
+    def add(self, rule):
+        signature = self._hasher.signature(rule_tokens(rule))
+        rule_id = len(self.rules)
+        self.rules.append(rule)
+        self._signatures.append(signature)
+        self._anchors.append(anchor_tokens(rule))
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, []).append(rule_id)
+
+    def find_duplicate(self, rule):
+        """
+        Returns the most similar existing rule above the threshold, or None.
+        """
+        tokens = rule_tokens(rule)
+        if not tokens:
+            return None
+        signature = self._hasher.signature(tokens)
+        anchors = anchor_tokens(rule)
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates.update(self._buckets.get(key, ()))
+
+        best, best_score = None, 0.0
+        for rule_id in candidates:
+            if self._anchors[rule_id] != anchors:
+                continue
+            other = self._signatures[rule_id]
+            score = sum(x == y for x, y in zip(signature, other)) / len(signature)
+            if score >= self.threshold and score > best_score:
+                best, best_score = self.rules[rule_id], score
+        return best
+
+
+_cached_index = None
+_cached_lock = threading.Lock()
+
+
+def index_for_prompt(prompt_text, threshold=0.6):
+    """
+    RuleIndex for a prompt version. Prompt versions only ever append rules, so the
+    index of the previous version is extended with the new rules instead of rebuilt.
+    """
+    global _cached_index
+    rules = extract_rules(prompt_text)
+    with _cached_lock:
+        index = _cached_index
+        if (index is None or index.threshold != threshold or len(index.rules) > len(rules)
+                or index.rules != rules[:len(index.rules)]):
+            index = RuleIndex(threshold=threshold)
+            metrics.incr("rules.index_rebuilds")
+        for rule in rules[len(index.rules):]:
+            index.add(rule)
+        _cached_index = index
+        return index
+
+
+def check_new_rule(prompt_text, rule, threshold=0.6):
+    """
+    Raises DuplicateRule if `rule` is a near-duplicate of a rule already in `prompt_text`.
+    """
+    existing = index_for_prompt(prompt_text, threshold).find_duplicate(rule)
+    if existing is not None:
+        metrics.incr("rules.duplicates")
+        raise DuplicateRule(rule, existing)
+    metrics.incr("rules.accepted")
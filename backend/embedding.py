@@ -0,0 +1,58 @@
+import re
+import zlib
+
+import numpy as np
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+class HashingVectorizer:
+    """
+    CPU-only text embedding: word unigrams/bigrams and character 3-grams are
+    hashed into a fixed number of signed dimensions, optionally IDF-weighted,
+    then L2-normalised, so the dot product of two vectors is their cosine
+    similarity. No vocabulary to store, no external service.
+    """
+
+    def __init__(self, dim=2048, char_weight=0.5):
+        self.dim = dim
+        self.char_weight = char_weight
+        self.idf = None
+
+    def _features(self, text):
+        words = _WORD.findall(text.lower())
+        for word in words:
+            yield word, 1.0
+        for a, b in zip(words, words[1:]):
+            yield f"{a} {b}", 1.0
+        for word in words:
+            padded = f" {word} "
+            for i in range(len(padded) - 2):
+                yield "#" + padded[i:i + 3], self.char_weight
+
+    def fit(self, texts):
+        """
+        Learns IDF weights per hashed dimension so frequent words ("how", "the", "visa")
+        count less than the ones that carry the question.
+        """
+        df = np.zeros(self.dim, dtype=np.float32)
+        for text in texts:
+            df[np.nonzero(self._raw(text))[0]] += 1
+        self.idf = (np.log((1 + len(texts)) / (1 + df)) + 1).astype(np.float32)
+        return self
+
+    def _raw(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(text):
+            h = zlib.crc32(feature.encode('utf-8'))
+            vector[h % self.dim] += weight if h & 0x80000000 else -weight
+        return vector
+
+    def embed(self, text):
+        vector = self._raw(text)
+        if self.idf is not None:
+            vector *= self.idf
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
@@ -0,0 +1,92 @@
+import os
+import time
+import sqlite3
+import hashlib
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'eval_cache.sqlite3')
+
+
+def prompt_hash(messages):
+    """
+    Hash of the effective prompt: the system messages actually sent for a sample.
+    """
+    system = "\n".join(m['content'] for m in messages if m.get('role') == 'system')
+    return hashlib.sha256(system.encode('utf-8')).hexdigest()[:16]
+
+
+class EvalCache:
+    """
+    Persistent evaluation results keyed by a hash of the fully built request
+    (effective prompt, history, client message, model and parameters), so a
+    prompt version that only appended a rule re-runs just the samples whose
+    request actually changed.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("EVAL_CACHE_PATH", DEFAULT_PATH)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS eval_results (
+                key TEXT PRIMARY KEY,
+                prompt_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prediction TEXT NOT NULL,
+                score REAL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_eval_results_prompt ON eval_results (prompt_hash)")
+        self._conn.commit()
+
+    def get(self, key):
+        row = self._conn.execute("SELECT prediction, score FROM eval_results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("UPDATE eval_results SET last_used_at = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+        return {"prediction": row[0], "score": row[1]}
+
+    def put(self, key, prompt_hash, model, prediction, score):
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO eval_results (key, prompt_hash, model, prediction, score, created_at, last_used_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, prompt_hash, model, prediction, score, now, now)
+        )
+        self._conn.commit()
+
+    def stats(self):
+        """
+        One row per (effective prompt, model): sample count, mean score and last use.
+        """
+        rows = self._conn.execute("""
+            SELECT prompt_hash, model, COUNT(*), AVG(score), MAX(last_used_at)
+            FROM eval_results GROUP BY prompt_hash, model ORDER BY MAX(last_used_at) DESC
+        """).fetchall()
+        return [
+            {"prompt_hash": r[0], "model": r[1], "samples": r[2],
+             "mean_score": round(r[3], 4) if r[3] is not None else None, "last_used_at": r[4]}
+            for r in rows
+        ]
+
+    def prune(self, older_than_days=None, prompt_hash=None):
+        """
+        Deletes entries not used for `older_than_days`, and/or those of one effective prompt.
+        Returns the number of deleted rows.
+        """
+        clauses, params = [], []
+        if older_than_days is not None:
+            clauses.append("last_used_at < ?")
+            params.append(time.time() - older_than_days * 86400)
+        if prompt_hash is not None:
+            clauses.append("prompt_hash = ?")
+            params.append(prompt_hash)
+        if not clauses:
+            return 0
+        cursor = self._conn.execute(f"DELETE FROM eval_results WHERE {' AND '.join(clauses)}", params)
+        self._conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        self._conn.close()
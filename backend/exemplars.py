@@ -0,0 +1,128 @@
+import os
+import json
+import time
+
+import numpy as np
+
+import metrics
+from embedding import HashingVectorizer
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exemplar_index')
+
+# How much the last history turn contributes to an exemplar's vector, relative to the client message
+TAIL_WEIGHT = 0.3
+# Extra candidates scored per lookup so excluded exemplars (the sample's own conversation) can be skipped
+EXCLUDE_SLACK = 32
+
+
+def _turn_text(turn):
+    if isinstance(turn, dict):
+        return turn.get('message', turn.get('content', ''))
+    text = str(turn)
+    for prefix in ("Client: ", "Consultant: "):
+        if text.startswith(prefix):
+            return text[len(prefix):]
+    return text
+
+
+def embed_query(vectorizer, client_sequence, history):
+    vector = vectorizer.embed(client_sequence)
+    if history:
+        vector = vector + TAIL_WEIGHT * vectorizer.embed(_turn_text(history[-1]))
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+    return vector.astype(np.float32)
+
+
+def build_index(samples, index_dir=DEFAULT_INDEX_DIR, dim=2048, tail_turns=2):
+    """
+    Writes the index for load_data()-style samples: vectors.npy (one row per
+    sample), idf.npy, and exemplars.json with the texts shown to the model.
+    """
+    vectorizer = HashingVectorizer(dim=dim).fit([s['client_input'] for s in samples])
+    vectors = np.zeros((len(samples), dim), dtype=np.float32)
+    exemplars = []
+    for i, sample in enumerate(samples):
+        vectors[i] = embed_query(vectorizer, sample['client_input'], sample['history'])
+        exemplars.append({
+            "contact_id": sample.get('contact_id'),
+            "history_tail": sample['history'][-tail_turns:],
+            "client_input": sample['client_input'],
+            "consultant_response": sample['consultant_response'],
+        })
+
+    os.makedirs(index_dir, exist_ok=True)
+    np.save(os.path.join(index_dir, 'vectors.npy'), vectors)
+    np.save(os.path.join(index_dir, 'idf.npy'), vectorizer.idf)
+    with open(os.path.join(index_dir, 'exemplars.json'), 'w', encoding='utf-8') as f:
+        json.dump({"dim": dim, "char_weight": vectorizer.char_weight, "exemplars": exemplars}, f, ensure_ascii=False)
+    return len(exemplars)
+
+
+class ExemplarIndex:
+    """
+    Few-shot examples from real consultant conversations. The vectors are
+    memory-mapped, so worker processes share the pages and startup stays fast.
+    """
+
+    def __init__(self, vectors, vectorizer, exemplars, k=2, min_score=0.3):
+        self._vectors = vectors
+        self._vectorizer = vectorizer
+        self._exemplars = exemplars
+        self.k = k
+        self.min_score = min_score
+
+    @classmethod
+    def load(cls, index_dir=DEFAULT_INDEX_DIR, k=2, min_score=0.3):
+        with open(os.path.join(index_dir, 'exemplars.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        vectorizer = HashingVectorizer(dim=meta['dim'], char_weight=meta['char_weight'])
+        vectorizer.idf = np.load(os.path.join(index_dir, 'idf.npy'))
+        vectors = np.load(os.path.join(index_dir, 'vectors.npy'), mmap_mode='r')
+        return cls(vectors, vectorizer, meta['exemplars'], k=k, min_score=min_score)
+
+    @classmethod
+    def from_env(cls):
+        """
+        Loads the index from EXEMPLAR_INDEX_DIR, or returns None if it hasn't been
+        built (scripts/build_exemplar_index.py) or EXEMPLARS_K is 0.
+        """
+        k = int(os.environ.get("EXEMPLARS_K", 2))
+        index_dir = os.environ.get("EXEMPLAR_INDEX_DIR", DEFAULT_INDEX_DIR)
+        if k <= 0 or not os.path.exists(os.path.join(index_dir, 'exemplars.json')):
+            return None
+        return cls.load(index_dir, k=k, min_score=float(os.environ.get("EXEMPLAR_MIN_SCORE", 0.3)))
+
+    def __len__(self):
+        return len(self._exemplars)
+
+    def nearest(self, client_sequence, history, exclude_contact=None, exclude_reply=None):
+        """
+        Up to k exemplars most similar to the message (and its last history turn), best first.
+        Training and evaluation pass the sample's contact and ground-truth reply, so
+        the answer being scored is never shown to the model as an example.
+        """
+        start = time.perf_counter()
+        scores = self._vectors @ embed_query(self._vectorizer, client_sequence, history)
+        excluding = exclude_contact is not None or exclude_reply is not None
+        wanted = self.k + EXCLUDE_SLACK if excluding else self.k
+        if len(scores) > wanted:
+            top = np.argpartition(-scores, wanted)[:wanted]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        reply = exclude_reply.strip() if exclude_reply else None
+        results = []
+        for i in top:
+            exemplar = self._exemplars[i]
+            if scores[i] < self.min_score or len(results) == self.k:
+                break
+            if exclude_contact is not None and exemplar.get('contact_id') == exclude_contact:
+                continue
+            if reply is not None and exemplar['consultant_response'].strip() == reply:
+                continue
+            results.append(exemplar)
+        metrics.observe("exemplars.lookup_us", int((time.perf_counter() - start) * 1e6))
+        metrics.observe("exemplars.returned", len(results))
+        return results
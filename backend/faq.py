@@ -0,0 +1,245 @@
+import os
+import re
+import json
+import math
+from collections import Counter
+
+import metrics
+from routing import ESCALATION_KEYWORDS
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'conversations.json')
+
+_COUNTRIES = r"\b(singapore|laos|indonesia|malaysia|vietnam|taiwan|cambodia|korea|bali|jakarta|kl)\b"
+_AMOUNTS = r"\d{2,3}[,.]?\d{3}|[$\u00a3\u20ac]\s?\d|\b\d+\s*(sgd|usd|eur|gbp|aud)\b"
+# Urgency, rejections, dependents and personal circumstances need a tailored answer for every intent
+_URGENCY = r"\b(flight|deadline|tomorrow|tonight|next week|this week|running out|expir\w*|as soon as)\b"
+_DEPENDENTS = r"\b(wife|husband|spouse|partner|kids?|child(ren)?|son|daughter|family|dependents?)\b"
+_PERSONAL = r"\b(citizen\w*|passports?|nationality|national)\b"
+_TAILORED = [ESCALATION_KEYWORDS.pattern, _URGENCY, _DEPENDENTS, _PERSONAL]
+
+# Approved template answers for questions the system prompt already answers.
+# - patterns: keyword/regex triggers on the client message (at least one must match)
+# - exclude: regexes that mean the question needs a tailored answer (specific amounts, countries, ...)
+# - evidence: regex on consultant replies; used to harvest n-gram exemplars from
+#   conversations.json and to detect that the answer was already given in the history
+# - examples: seed phrasings in addition to the harvested ones
+FAQ_INTENTS = [
+    {
+        "name": "service_fee",
+        "patterns": [r"\b(service )?fees?\b", r"\bhow much\b.*\b(cost|charge|pay)\b", r"\bpric(e|es|ing)\b"],
+        "exclude": [_COUNTRIES, r"\b(deduct|hidden|different|reappl|gym|school)", *_TAILORED],
+        "evidence": r"service fee",
+        "examples": [
+            "How much is your service fee?",
+            "What's your fee?",
+            "How much do you charge for the DTV?",
+        ],
+        "answer": (
+            "Our standard service fee is 18,000 THB, which includes all government fees - no hidden fees. "
+            "Pricing can vary by submission country and visa type, and you only pay after our legal team "
+            "has reviewed and approved your documents. May I know which country you'd like to apply from "
+            "so I can confirm the exact price?"
+        ),
+    },
+    {
+        "name": "bank_balance",
+        "patterns": [r"\b500\s*(k|,?000)\b", r"\bbank (balance|statement)s?\b", r"\bproof of funds\b"],
+        "exclude": [_AMOUNTS, r"\b(crypto|stocks?|invest|again|re-?enter|entry)", *_TAILORED],
+        "evidence": r"500,000 THB",
+        "examples": [
+            "What about the 500k THB bank requirement?",
+            "How much money do I need in my bank account?",
+            "What is the bank balance requirement?",
+        ],
+        "answer": (
+            "You'll need bank statements showing the equivalent of 500,000 THB (about $14,000-15,000 USD or "
+            "19,000-20,000 SGD) for the past 3 months. The funds don't need to be converted to THB - the "
+            "equivalent amount in your own currency is fine. Please keep the balance until your visa is approved."
+        ),
+    },
+    {
+        "name": "processing_time_singapore",
+        "patterns": [r"\b(how long|processing|take)\b.*\bsingapore\b", r"\bsingapore\b.*\b(how long|processing|take)\b"],
+        "exclude": _TAILORED,
+        "evidence": r"Singapore typically takes",
+        "examples": ["How long does processing take in Singapore?"],
+        "answer": (
+            "Processing in Singapore typically takes 7-10 business days. Please remain in Singapore until your "
+            "visa is approved, as leaving early voids our money-back guarantee. You can upload your documents "
+            "through our app for a free review in the meantime."
+        ),
+    },
+    {
+        "name": "processing_time_laos",
+        "patterns": [r"\b(how long|processing|take)\b.*\blaos\b", r"\blaos\b.*\b(how long|processing|take)\b"],
+        "exclude": _TAILORED,
+        "evidence": r"processing time in Laos",
+        "examples": ["How long does processing take in Laos?"],
+        "answer": (
+            "Processing in Laos typically takes 3-5 business days, and fast-track is available. Please remain "
+            "in Laos until your visa is approved. You can upload your documents through our app for a free "
+            "review in the meantime."
+        ),
+    },
+    {
+        "name": "money_back_guarantee",
+        "patterns": [r"\bmoney[- ]back\b", r"\bguarantee\b", r"\brefund\b"],
+        "exclude": _TAILORED,
+        "evidence": r"money-back guarantee|refund",
+        "examples": [
+            "What's this money-back guarantee I keep hearing about?",
+            "Are there countries without guarantee?",
+        ],
+        "answer": (
+            "Our money-back guarantee is available in most submission countries. It is NOT available in Taiwan "
+            "(due to unpredictable interview requirements) or for reapplications after a previous rejection, "
+            "which are handled case-by-case. The guarantee also requires you to remain in the submission country "
+            "until your visa is approved - leaving before approval voids it."
+        ),
+    },
+]
+
+# Longer client messages carry specifics a template answer would ignore
+HARVEST_MAX_WORDS = 15
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+def _ngrams(text):
+    """
+    Word unigrams and bigrams of a lower-cased message.
+    """
+    tokens = _TOKEN_RE.findall(text.lower())
+    grams = Counter(tokens)
+    grams.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    return grams
+
+
+def _cosine(a, b):
+    if not a or not b:
+        return 0.0
+    dot = sum(count * b.get(gram, 0) for gram, count in a.items())
+    if not dot:
+        return 0.0
+    norm_a = math.sqrt(sum(c * c for c in a.values()))
+    norm_b = math.sqrt(sum(c * c for c in b.values()))
+    return dot / (norm_a * norm_b)
+
+
+def _load_interactions(data_file):
+    """
+    Yields (client_input, consultant_response) pairs from conversations.json,
+    merging consecutive messages in the same direction like scripts/utils.load_data.
+    """
+    if not os.path.exists(data_file):
+        return
+    try:
+        with open(data_file, 'r', encoding='utf-8') as f:
+            conversations = json.load(f)
+    except Exception as e:
+        print(f"Error reading FAQ training data: {e}")
+        return
+
+    for conv in conversations:
+        messages = conv.get('conversation', [])
+        i = 0
+        while i < len(messages):
+            client_sequence = []
+            while i < len(messages) and messages[i]['direction'] == 'in':
+                client_sequence.append(messages[i]['text'])
+                i += 1
+            consultant_sequence = []
+            while i < len(messages) and messages[i]['direction'] == 'out':
+                consultant_sequence.append(messages[i]['text'])
+                i += 1
+            if client_sequence and consultant_sequence:
+                yield "\n".join(client_sequence), "\n".join(consultant_sequence)
+
+
+class FaqMatcher:
+    """
+    Lexical intent matcher: a regex trigger must fire and the message must be
+    close (word n-gram cosine) to known phrasings of the same question.
+    Everything is compiled once at startup so matching costs microseconds.
+    """
+
+    def __init__(self, intents, interactions=(), threshold=0.75, max_words=20):
+        self.threshold = threshold
+        self.max_words = max_words
+        self.intents = []
+        for intent in intents:
+            self.intents.append({
+                "name": intent["name"],
+                "patterns": [re.compile(p, re.IGNORECASE) for p in intent["patterns"]],
+                "exclude": [re.compile(p, re.IGNORECASE) for p in intent.get("exclude", [])],
+                "evidence": re.compile(intent["evidence"], re.IGNORECASE),
+                "exemplars": [_ngrams(example) for example in intent.get("examples", [])],
+                "answer": intent["answer"],
+            })
+
+        # Harvest exemplars: short client questions whose real consultant reply contains the intent's evidence
+        for client_input, consultant_response in interactions:
+            if len(client_input.split()) > HARVEST_MAX_WORDS:
+                continue
+            for intent in self.intents:
+                if intent["evidence"].search(consultant_response) and self._triggers(intent, client_input):
+                    intent["exemplars"].append(_ngrams(client_input))
+
+    @staticmethod
+    def _triggers(intent, text):
+        return any(p.search(text) for p in intent["patterns"]) and not any(p.search(text) for p in intent["exclude"])
+
+    @classmethod
+    def from_env(cls, data_file=DATA_FILE):
+        threshold = float(os.environ.get("FAQ_CONFIDENCE_THRESHOLD", 0.75))
+        max_words = int(os.environ.get("FAQ_MAX_WORDS", 20))
+        return cls(FAQ_INTENTS, _load_interactions(data_file), threshold=threshold, max_words=max_words)
+
+    def classify(self, client_sequence):
+        """
+        Returns (intent, confidence) for the best scoring intent, or (None, 0.0).
+        """
+        if not client_sequence or len(client_sequence.split()) > self.max_words:
+            return None, 0.0
+
+        grams = _ngrams(client_sequence)
+        best, best_score, runner_up = None, 0.0, 0.0
+        for intent in self.intents:
+            if not self._triggers(intent, client_sequence):
+                continue
+            similarity = max((_cosine(grams, ex) for ex in intent["exemplars"]), default=0.0)
+            score = 0.6 + 0.4 * similarity
+            if score > best_score:
+                best, best_score, runner_up = intent, score, best_score
+            elif score > runner_up:
+                runner_up = score
+
+        # Two intents firing with similar confidence means a compound question: leave it to the LLM
+        if best is not None and best_score - runner_up < 0.1:
+            return None, best_score
+        return best, best_score
+
+    def answer(self, client_sequence, history=None):
+        """
+        Returns the approved template answer when confident, otherwise None.
+        """
+        intent, confidence = self.classify(client_sequence)
+        if intent is None or confidence < self.threshold:
+            metrics.incr("faq.misses")
+            return None
+
+        # Don't repeat information the consultant already gave in this conversation
+        for msg in history or []:
+            if isinstance(msg, dict):
+                role = msg.get('role')
+                content = msg.get('message', msg.get('content', ''))
+            else:
+                role, _, content = str(msg).partition(': ')
+                role = role.lower()
+            if role in ('consultant', 'assistant') and intent["evidence"].search(content or ''):
+                metrics.incr("faq.misses")
+                return None
+
+        metrics.incr("faq.hits")
+        metrics.incr(f"faq.hits.{intent['name']}")
+        return intent["answer"]
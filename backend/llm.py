@@ -0,0 +1,142 @@
+import os
+import time
+
+from groq import Groq, RateLimitError, DefaultHttpxClient
+
+import metrics
+import deadlines
+import ratelimit
+from cassette import CassetteTransport
+from warmup import pool_limits
+from singleflight import SingleFlight, request_key
+
+DEFAULT_SMALL_MODEL = "llama-3.1-8b-instant"
+DEFAULT_LARGE_MODEL = "llama-3.3-70b-versatile"
+
+# Identical requests in flight at the same time (e.g. after a broadcast) share one upstream call
+_flight = SingleFlight("llm")
+
+# Upper bound (seconds per attempt) for every completion, also when a request has no deadline
+DEFAULT_TIMEOUT_SECONDS = 60.0
+
+
+def model_for(tier):
+    """
+    Maps a tier name to a model. Read at call time so .env changes loaded
+    after import are respected. A deployment that pins MODEL_NAME (and not
+    LARGE_MODEL_NAME) keeps that model for both tiers.
+    """
+    if tier == "large":
+        return os.environ.get("LARGE_MODEL_NAME", os.environ.get("MODEL_NAME", DEFAULT_LARGE_MODEL))
+    return os.environ.get("SMALL_MODEL_NAME", os.environ.get("MODEL_NAME", DEFAULT_SMALL_MODEL))
+
+
+def create_client():
+    """
+    Groq client used by the app and every script.
+    LLM_CASSETTE_MODE=record|replay routes it through the cassette transport
+    (replay needs no network and no real API key).
+    """
+    transport = CassetteTransport.from_env()
+    if transport is None:
+        # Persistent keep-alive pool (HTTP_POOL_* settings) shared by all requests of the process
+        return Groq(
+            api_key=os.environ.get("GROQ_API_KEY"),
+            http_client=DefaultHttpxClient(limits=pool_limits()),
+        )
+    return Groq(
+        api_key=os.environ.get("GROQ_API_KEY") or "cassette-replay",
+        http_client=DefaultHttpxClient(transport=transport),
+    )
+
+
+def _retry_after(error):
+    try:
+        return float(error.response.headers.get("retry-after", 0))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+
+def record_usage(completion, tier):
+    """
+    Records prompt and cached (prefix-cache hit) token counts for one request.
+    """
+    usage = getattr(completion, 'usage', None)
+    if usage is None or not getattr(usage, 'prompt_tokens', None):
+        return
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached = (getattr(details, 'cached_tokens', 0) or 0) if details else 0
+
+    metrics.incr("llm.prompt_tokens", usage.prompt_tokens)
+    metrics.incr("llm.cached_tokens", cached)
+    metrics.observe(f"llm.prompt_tokens.{tier}", usage.prompt_tokens)
+    metrics.observe(f"llm.cached_tokens.{tier}", cached)
+    metrics.observe(f"llm.prompt_cache_ratio.{tier}", round(cached / usage.prompt_tokens, 4))
+
+
+def chat_completion(client, messages, tier="small", **params):
+    """
+    Single entry point for Groq chat completions. Records per-tier call counts and latency.
+    Inside a request with a deadline/disconnect watch the call is bounded by the
+    remaining time and abandoned as soon as the request is cancelled.
+    Concurrent calls with the same model, messages and params share one upstream call
+    (LLM_SINGLE_FLIGHT=0 disables this).
+    """
+    if os.environ.get("LLM_SINGLE_FLIGHT", "1") == "0":
+        return _chat_completion(client, messages, tier, **params)
+
+    key = request_key(model_for(tier), messages, {k: v for k, v in params.items() if k != "timeout"})
+    return _flight.do(key, lambda: _chat_completion(client, messages, tier, **params))
+
+
+def _chat_completion(client, messages, tier, **params):
+    context = deadlines.current()
+    if context is not None:
+        context.check()
+
+    # Shared outbound quota: live chat > admin improvements > batch jobs
+    limiter = ratelimit.get_limiter()
+    estimated_tokens = ratelimit.estimate_tokens(messages, params.get("max_tokens"))
+    limiter.acquire(estimated_tokens)
+
+    # Always bounded: a call abandoned by a disconnected client must not run for the SDK's default
+    timeout = float(os.environ.get("LLM_TIMEOUT_SECONDS", DEFAULT_TIMEOUT_SECONDS))
+    remaining = context.remaining() if context is not None else None
+    params.setdefault("timeout", min(timeout, remaining) if remaining is not None else timeout)
+
+    in_flight = {}
+
+    def call():
+        # Streaming response wrapper so a cancelled request can close the connection
+        with client.chat.completions.with_streaming_response.create(model=model_for(tier), messages=messages, **params) as response:
+            in_flight['response'] = response
+            completion = response.parse()
+        # Settled here so calls that finish after being abandoned still correct the quota
+        record_usage(completion, tier)
+        usage = getattr(completion, 'usage', None)
+        limiter.settle(estimated_tokens, getattr(usage, 'total_tokens', None))
+        return completion
+
+    def cancel():
+        response = in_flight.get('response')
+        if response is not None:
+            response.close()
+
+    start = time.time()
+    try:
+        if context is None:
+            return call()
+        return deadlines.run_cancellable(call, context, on_cancel=cancel, name="llm")
+    except deadlines.RequestCancelled:
+        metrics.incr(f"llm.cancelled.{tier}")
+        raise
+    except RateLimitError as e:
+        metrics.incr(f"llm.rate_limited.{tier}")
+        limiter.block_for(_retry_after(e) or 1.0)
+        raise
+    except Exception:
+        metrics.incr(f"llm.errors.{tier}")
+        raise
+    finally:
+        metrics.incr(f"llm.calls.{tier}")
+        metrics.observe(f"llm.latency_ms.{tier}", int((time.time() - start) * 1000))
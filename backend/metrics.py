@@ -0,0 +1,88 @@
+import threading
+from collections import deque
+
+# Number of recent observations kept per metric for percentile estimates
+RECENT_WINDOW = 512
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_observations = {}
+
+
+def incr(name, value=1):
+    """
+    Increments a counter by `value`.
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name, value):
+    """
+    Sets a gauge to its current value.
+    """
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name, value):
+    """
+    Records a single observation (e.g. a latency in ms).
+    Keeps count/sum/min/max plus a window of recent values for percentiles.
+    """
+    with _lock:
+        stats = _observations.get(name)
+        if stats is None:
+            stats = {"count": 0, "sum": 0.0, "min": value, "max": value, "recent": deque(maxlen=RECENT_WINDOW)}
+            _observations[name] = stats
+        stats["count"] += 1
+        stats["sum"] += value
+        stats["min"] = min(stats["min"], value)
+        stats["max"] = max(stats["max"], value)
+        stats["recent"].append(value)
+
+
+def get_counter(name):
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def ratio(numerator, denominator):
+    """
+    Returns numerator / (numerator + denominator) for two counters, or None if both are zero.
+    """
+    with _lock:
+        hits = _counters.get(numerator, 0)
+        total = hits + _counters.get(denominator, 0)
+    return round(hits / total, 4) if total else None
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def snapshot():
+    """
+    Returns a JSON-serializable view of every metric.
+    """
+    with _lock:
+        observations = {}
+        for name, stats in _observations.items():
+            recent = sorted(stats["recent"])
+            observations[name] = {
+                "count": stats["count"],
+                "avg": round(stats["sum"] / stats["count"], 3),
+                "min": stats["min"],
+                "max": stats["max"],
+                "p50": _percentile(recent, 50),
+                "p95": _percentile(recent, 95),
+            }
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "observations": observations,
+        }
@@ -2,6 +2,10 @@ import os
 import json
 from groq import Groq
 
+from llm import chat_completion
+from routing import editor_tier
+from dedup import check_new_rule
+
 EDITOR_SYSTEM_PROMPT = """
 # AI Chatbot Prompt Engineer - System Prompt
 
@@ -26,23 +30,44 @@ def extract_prompt_from_markdown(content):
         return match.group(1).strip()
     return content.strip()
 
-def run_editor_optimization(client: Groq, current_prompt, sample_data, predicted_reply):
+def format_history_text(history):
     """
-    Runs the optimization loop and programmatically appends the result.
+    Renders a history (list of dicts or "Role: text" strings) as plain text for the editor prompt.
     """
-    
-    # Handle history formatting
     history_str = ""
-    if isinstance(sample_data['history'], list):
-        if len(sample_data['history']) > 0 and isinstance(sample_data['history'][0], dict):
+    if isinstance(history, list):
+        if len(history) > 0 and isinstance(history[0], dict):
              lines = []
-             for msg in sample_data['history']:
+             for msg in history:
                  role = msg.get('role', 'unknown').capitalize()
                  content = msg.get('message', msg.get('content', ''))
                  lines.append(f"{role}: {content}")
              history_str = "\n".join(lines)
         else:
-            history_str = "\n".join(sample_data['history'])
+            history_str = "\n".join(history)
+    return history_str
+
+def append_rule(current_prompt, new_instruction, check_duplicates=True):
+    """
+    Appends a rule to the prompt, rejecting near-duplicates of existing rules (raises DuplicateRule).
+    """
+    if check_duplicates:
+        check_new_rule(current_prompt, new_instruction, float(os.environ.get("RULE_DEDUP_THRESHOLD", 0.6)))
+
+    # Programmatic Appending
+    # Ensure there's a newline before the new instruction
+    if not current_prompt.endswith("\n"):
+        current_prompt += "\n"
+
+    return f"{current_prompt}- {new_instruction}\n"
+
+def run_editor_optimization(client: Groq, current_prompt, sample_data, predicted_reply):
+    """
+    Runs the optimization loop and programmatically appends the result.
+    """
+    
+    # Handle history formatting
+    history_str = format_history_text(sample_data['history'])
             
     user_content = f"""
     Please analyze this interaction:
@@ -55,26 +80,21 @@ def run_editor_optimization(client: Groq, current_prompt, sample_data, predicted
     Generate ONE concise instruction to append to the prompt.
     """
     
-    completion = client.chat.completions.create(
-        model=os.environ.get("MODEL_NAME", "llama-3.1-8b-instant"),
-        messages=[
+    completion = chat_completion(
+        client,
+        [
             {"role": "system", "content": EDITOR_SYSTEM_PROMPT},
             {"role": "user", "content": user_content}
         ],
+        tier=editor_tier(),
         temperature=0.2,
         max_tokens=500,
     )
     
     new_instruction = extract_prompt_from_markdown(completion.choices[0].message.content)
-    
-    # Programmatic Appending
-    # Ensure there's a newline before the new instruction
-    if not current_prompt.endswith("\n"):
-        current_prompt += "\n"
-    
-    return f"{current_prompt}- {new_instruction}\n"
+    return append_rule(current_prompt, new_instruction)
 
-def run_manual_optimization(client: Groq, current_prompt, instructions):
+def run_manual_optimization(client: Groq, current_prompt, instructions, check_duplicates=True):
     """
     Manually updates the prompt by appending instructions.
     """
@@ -83,20 +103,16 @@ def run_manual_optimization(client: Groq, current_prompt, instructions):
     Return ONLY the rule text.
     """
     
-    completion = client.chat.completions.create(
-        model=os.environ.get("MODEL_NAME", "llama-3.1-8b-instant"),
-        messages=[
+    completion = chat_completion(
+        client,
+        [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": f"Convert this instruction into a concise system prompt rule: {instructions}"}
         ],
+        tier=editor_tier(),
         temperature=0.2,
         max_tokens=500,
     )
     
     new_instruction = extract_prompt_from_markdown(completion.choices[0].message.content)
-
-    # Programmatic Appending
-    if not current_prompt.endswith("\n"):
-        current_prompt += "\n"
-    
-    return f"{current_prompt}- {new_instruction}\n"
+    return append_rule(current_prompt, new_instruction, check_duplicates)
@@ -0,0 +1,118 @@
+import json
+
+# Everything before this heading is the static core of the prompt; learned rules are appended after it
+RULES_MARKER = "## Scenario Improvements"
+
+# CRITICAL: Groq requires the word "json" in the messages when response_format is json_object
+JSON_INSTRUCTION = "IMPORTANT: You must respond in JSON format."
+
+
+def split_prompt(prompt_text):
+    """
+    Splits a prompt version into (core, rules). The core is identical across
+    prompt versions because improvements only ever append below RULES_MARKER.
+    """
+    index = prompt_text.find(RULES_MARKER)
+    if index == -1:
+        return prompt_text, ""
+    return prompt_text[:index], prompt_text[index:]
+
+
+def format_exemplars(exemplars):
+    """
+    Renders retrieved consultant exchanges as one system message of few-shot examples.
+    """
+    blocks = []
+    for i, exemplar in enumerate(exemplars, 1):
+        lines = [f"Example {i}:"]
+        lines.extend(exemplar.get('history_tail', []))
+        lines.append(f"Client: {exemplar['client_input']}")
+        lines.append(f"Consultant: {exemplar['consultant_response']}")
+        blocks.append("\n".join(lines))
+    return "Real replies from our consultants to similar messages. Match their tone and facts:\n\n" + "\n\n".join(blocks)
+
+
+def build_messages(prompt_text, formatted_history, client_sequence, exemplars=None, client_state=None):
+    """
+    Lays out the chat messages so provider-side prefix caching can reuse as much as possible:
+    1. static core of the system prompt (byte-stable across requests and prompt versions)
+    2. learned rules + JSON instruction (changes with each prompt version)
+    3. retrieved few-shot exemplars, if any (change per message)
+    4. structured client state replacing older turns of a long conversation, if any
+    5. history, then the new client message (grows turn by turn within a conversation)
+    """
+    core, rules = split_prompt(prompt_text)
+    dynamic = f"{rules.strip()}\n\n{JSON_INSTRUCTION}" if rules.strip() else JSON_INSTRUCTION
+
+    messages = [
+        {"role": "system", "content": core.rstrip()},
+        {"role": "system", "content": dynamic},
+    ]
+    if exemplars:
+        messages.append({"role": "system", "content": format_exemplars(exemplars)})
+    if client_state:
+        messages.append({"role": "system", "content": client_state})
+    messages.extend(formatted_history)
+    messages.append({"role": "user", "content": client_sequence})
+    return messages
+
+
+def format_history(history_data):
+    """
+    Formats history (list of dicts or strings) into Groq-compatible messages.
+    User format: [{"role": "consultant", "message": "..."}]
+    Groq format: [{"role": "assistant", "content": "..."}]
+    """
+    formatted_messages = []
+    if not isinstance(history_data, list):
+        return formatted_messages
+
+    for msg in history_data:
+        if isinstance(msg, dict):
+            role = msg.get('role', 'user')
+            content = msg.get('message', msg.get('content', ''))
+
+            # Map role names
+            if role == 'consultant':
+                role = 'assistant'
+            elif role == 'client':
+                role = 'user'
+
+            formatted_messages.append({"role": role, "content": content})
+        elif isinstance(msg, str):
+            # Fallback for raw strings if any
+            formatted_messages.append({"role": "user", "content": msg})
+
+    return formatted_messages
+
+
+def parse_reply(response_content):
+    """
+    Extracts the reply text from a model response.
+    Returns (reply, valid) where `valid` is True only for our standard
+    {"reply": "..."} JSON; anything else went through a fallback.
+    """
+    try:
+        # Attempt to parse as JSON
+        json_response = json.loads(response_content)
+
+        # Priority 1: Check for "reply" (Our standard)
+        if "reply" in json_response:
+            reply = str(json_response["reply"])
+            return reply, bool(reply.strip())
+
+        # Priority 2: Check for other common keys that Groq might hallucinate
+        for key in ["response", "aiReply", "message", "text", "content"]:
+            if key in json_response:
+                return str(json_response[key]), False
+
+        # Priority 3: If it's a flat dict with values, it might be the data itself
+        # but we really want the string. If it's just one key, return it.
+        if len(json_response) == 1:
+            return str(list(json_response.values())[0]), False
+
+        # Fallback: Stringify the whole object if we can't find a clear message
+        return json.dumps(json_response, indent=2), False
+    except:
+        # Fallback for plain text or malformed JSON
+        return response_content, False
@@ -0,0 +1,229 @@
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import metrics
+import deadlines
+
+# Lower number = more important. Live chat may drain the buckets completely,
+# lower classes must leave a share of the capacity for the classes above them.
+PRIORITIES = {"chat": 0, "admin": 1, "batch": 2}
+DEFAULT_RESERVES = {"chat": 0.0, "admin": 0.2, "batch": 0.5}
+
+DEFAULT_DB_PATH = os.path.join(tempfile.gettempdir(), 'dtv_ratelimit.sqlite3')
+
+_priority = contextvars.ContextVar("llm_priority", default=None)
+
+
+def current_priority():
+    return _priority.get() or os.environ.get("LLM_PRIORITY", "chat")
+
+
+def set_priority(name):
+    """
+    Sets the priority class for LLM calls made from the current context (e.g. a script's main()).
+    """
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown priority class: {name}")
+    return _priority.set(name)
+
+
+def reset_priority(token):
+    _priority.reset(token)
+
+
+@contextmanager
+def priority(name):
+    token = set_priority(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def estimate_tokens(messages, max_tokens=0):
+    """
+    Rough token estimate (~4 characters per token) of a request, including the completion budget.
+    """
+    chars = sum(len(m.get('content') or '') for m in messages)
+    return chars // 4 + (max_tokens or 0)
+
+
+class RateLimiter:
+    """
+    Token buckets for requests/minute and tokens/minute, stored in a local SQLite
+    file so every worker process and script on the host shares one quota.
+    A Retry-After from the API blocks all callers until it has passed.
+    """
+
+    def __init__(self, rpm=0, tpm=0, path=DEFAULT_DB_PATH, reserves=None, chat_max_wait=5.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.reserves = reserves or DEFAULT_RESERVES
+        self.chat_max_wait = chat_max_wait
+        self._path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL NOT NULL, updated_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS limiter_state (key TEXT PRIMARY KEY, value REAL NOT NULL)")
+
+    @classmethod
+    def from_env(cls):
+        reserves = {
+            name: float(os.environ.get(f"RATE_LIMIT_RESERVE_{name.upper()}", default))
+            for name, default in DEFAULT_RESERVES.items()
+        }
+        return cls(
+            rpm=float(os.environ.get("RATE_LIMIT_RPM", 0)),
+            tpm=float(os.environ.get("RATE_LIMIT_TPM", 0)),
+            path=os.environ.get("RATE_LIMIT_DB", DEFAULT_DB_PATH),
+            reserves=reserves,
+            chat_max_wait=float(os.environ.get("RATE_LIMIT_CHAT_MAX_WAIT", 5)),
+        )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _buckets(self, tokens):
+        """
+        (name, capacity, refill per second, amount needed) for each configured limit.
+        """
+        buckets = []
+        if self.rpm > 0:
+            buckets.append(("requests", self.rpm, self.rpm / 60.0, 1))
+        if self.tpm > 0:
+            buckets.append(("tokens", self.tpm, self.tpm / 60.0, tokens))
+        return buckets
+
+    def _try_acquire(self, priority_name, tokens, force=False):
+        """
+        Takes capacity if available. Returns 0 on success, else seconds to wait.
+        `force` takes it anyway (buckets may go negative and refill the debt
+        later), but never while a Retry-After block is active.
+        """
+        now = time.time()
+        reserve_fraction = self.reserves.get(priority_name, 0.0)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM limiter_state WHERE key = 'blocked_until'").fetchone()
+            if row and row[0] > now:
+                conn.execute("COMMIT")
+                return row[0] - now
+
+            wait = 0.0
+            levels = []
+            for name, capacity, rate, needed in self._buckets(tokens):
+                row = conn.execute("SELECT level, updated_at FROM buckets WHERE name = ?", (name,)).fetchone()
+                level = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+                reserve = capacity * reserve_fraction
+                # A single request larger than the bucket only needs what the class may use
+                needed = min(needed, capacity - reserve)
+                if level - needed < reserve:
+                    wait = max(wait, (needed + reserve - level) / rate)
+                levels.append((name, level, needed))
+
+            if wait == 0.0 or force:
+                for name, level, needed in levels:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO buckets (name, level, updated_at) VALUES (?, ?, ?)",
+                        (name, level - needed, now)
+                    )
+            conn.execute("COMMIT")
+            return 0.0 if force else wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def acquire(self, tokens):
+        """
+        Blocks until the current priority class may send a request of ~`tokens` tokens.
+        Live chat waits up to chat_max_wait (bounded by its request deadline) and
+        then sends anyway, still debiting the buckets. An active Retry-After block
+        is honoured by every class.
+        """
+        priority_name = current_priority()
+        start = time.time()
+        context = deadlines.current()
+        max_wait = self.chat_max_wait
+        if context is not None and context.remaining() is not None:
+            max_wait = min(max_wait, context.remaining())
+        while True:
+            wait = self._try_acquire(priority_name, tokens)
+            if wait == 0.0:
+                break
+            if priority_name == "chat":
+                left = max_wait - (time.time() - start)
+                if left <= 0:
+                    if self._try_acquire(priority_name, tokens, force=True) == 0.0:
+                        metrics.incr("ratelimit.chat_overrides")
+                        break
+                else:
+                    wait = min(wait, left)
+            if context is not None:
+                context.check()
+            time.sleep(min(wait, 0.25))
+        waited_ms = int((time.time() - start) * 1000)
+        metrics.observe(f"ratelimit.wait_ms.{priority_name}", waited_ms)
+        return waited_ms
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """
+        Corrects the token bucket once the real usage of a request is known.
+        """
+        if self.tpm <= 0 or actual_tokens is None:
+            return
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE buckets SET level = MIN(?, level + ?) WHERE name = 'tokens'",
+                (self.tpm, estimated_tokens - actual_tokens)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def block_for(self, seconds):
+        """
+        Honours a Retry-After: no class sends anything until it has passed.
+        """
+        until = time.time() + seconds
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO limiter_state (key, value) VALUES ('blocked_until', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)",
+                (until,)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        metrics.incr("ratelimit.retry_after_blocks")
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """
+    Process-wide limiter, created on first use so .env has been loaded by then.
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter.from_env()
+        return _limiter
@@ -0,0 +1,30 @@
+import os
+import re
+
+# Messages that are usually worth the larger model: time pressure, rejections, legal trouble
+ESCALATION_KEYWORDS = re.compile(
+    r"\b(urgent\w*|asap|emergency|immediately|reject\w*|denied|refused|overstay\w*|deport\w*|appeal|reappl\w*|blacklist\w*)\b",
+    re.IGNORECASE,
+)
+
+
+def choose_chat_tier(client_sequence, history):
+    """
+    Picks a model tier for a chat reply from cheap features.
+    Returns (tier, reason).
+    """
+    if os.environ.get("ROUTER_ENABLED", "1") != "1":
+        return "small", "disabled"
+    if isinstance(history, list) and len(history) >= int(os.environ.get("ROUTER_LONG_HISTORY", 12)):
+        return "large", "long_history"
+    if client_sequence and ESCALATION_KEYWORDS.search(client_sequence):
+        return "large", "keywords"
+    return "small", "default"
+
+
+def editor_tier():
+    """
+    Tier used by the prompt editor (/improve-ai, /improve-ai-manually, training).
+    Defaults to the small tier so existing deployments keep their model and cost.
+    """
+    return os.environ.get("EDITOR_MODEL_TIER", "small")
@@ -0,0 +1,176 @@
+import os
+import re
+import json
+import time
+import random
+import threading
+
+import numpy as np
+
+import metrics
+from embedding import HashingVectorizer
+from similarity import text_similarity
+from concurrent.futures import ThreadPoolExecutor
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'conversations.json')
+
+_NUMBERS = re.compile(r"\d+(?:[.,]\d+)*")
+_COUNTRIES = re.compile(r"\b(singapore|laos|indonesia|malaysia|vietnam|taiwan|cambodia|korea|bali|jakarta|kl|uk|usa|australia)\b")
+_NEGATIONS = re.compile(r"\b(not|no|never|without|cannot|can'?t|don'?t|doesn'?t|won'?t|isn'?t|aren'?t|didn'?t|shouldn'?t)\b")
+_INTRODUCTION = re.compile(r"\b(?:i'm|i am|my name is|this is)\s+([a-z]+)")
+
+
+def context_fingerprint(client_sequence):
+    """
+    Short description of what a reply depends on besides the wording: the
+    countries, numbers and self-introduced names in the message, and whether it
+    is negated. Cached replies are only reused within the same fingerprint, so
+    "Singapore" never answers "Laos" and "Can't I ..." never gets the answer to "Can I ...".
+    """
+    message = client_sequence.lower()
+    entities = (sorted(set(_COUNTRIES.findall(message))) + sorted(set(_NUMBERS.findall(message)))
+                + sorted(set(_INTRODUCTION.findall(message))))
+    return ",".join(entities) + ("|neg" if _NEGATIONS.search(message) else "|")
+
+
+class SemanticCache:
+    """
+    Reply cache keyed by the meaning of the client message: embeddings live in
+    a preallocated NumPy matrix and a lookup is one matrix-vector product.
+    Only the first message of a conversation is cached: later replies depend on
+    (and often personalise from) the history, which another conversation doesn't share.
+    Entries are scoped to the active prompt version and a context fingerprint,
+    evicted least-recently-used, and a share of hits is audited against a fresh
+    generation; a failed audit evicts the entry and counts a false hit.
+    """
+
+    def __init__(self, threshold=0.8, max_entries=2000, max_words=30, audit_rate=0.05,
+                 audit_min_similarity=0.5, vectorizer=None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_words = max_words
+        self.audit_rate = audit_rate
+        self.audit_min_similarity = audit_min_similarity
+        self._vectorizer = vectorizer or HashingVectorizer()
+        self._vectors = np.zeros((max_entries, self._vectorizer.dim), dtype=np.float32)
+        self._scopes = [None] * max_entries
+        self._entries = [None] * max_entries
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._size = 0
+        self._prompt_id = None
+        self._lock = threading.Lock()
+        self._audit_slots = threading.BoundedSemaphore(2)
+        self._audit_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-audit")
+
+    @classmethod
+    def from_env(cls, data_file=DATA_FILE):
+        # IDF weights come from the real client messages
+        vectorizer = HashingVectorizer()
+        try:
+            with open(data_file, 'r', encoding='utf-8') as f:
+                conversations = json.load(f)
+            vectorizer.fit([m['text'] for c in conversations for m in c.get('conversation', []) if m['direction'] == 'in'])
+        except (OSError, ValueError) as e:
+            print(f"Semantic cache: no IDF weights ({e})")
+        return cls(
+            threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", 0.8)),
+            max_entries=int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", 2000)),
+            audit_rate=float(os.environ.get("SEMANTIC_CACHE_AUDIT_RATE", 0.05)),
+            vectorizer=vectorizer,
+        )
+
+    def _reset_for_prompt(self, prompt_id):
+        # A new prompt version invalidates every cached reply
+        if prompt_id != self._prompt_id:
+            self._prompt_id = prompt_id
+            self._scopes = [None] * self.max_entries
+            self._entries = [None] * self.max_entries
+            self._last_used[:] = 0
+            self._size = 0
+            metrics.incr("semantic_cache.invalidations")
+
+    def cacheable(self, client_sequence, history):
+        return not history and len(client_sequence.split()) <= self.max_words
+
+    def lookup(self, client_sequence, history, prompt_id):
+        """
+        Returns (reply, entry_index, similarity) for the best match above the threshold, or None.
+        """
+        if not self.cacheable(client_sequence, history):
+            return None
+        query = self._vectorizer.embed(client_sequence)
+        scope = context_fingerprint(client_sequence)
+        with self._lock:
+            self._reset_for_prompt(prompt_id)
+            if not self._size:
+                metrics.incr("semantic_cache.misses")
+                return None
+            scores = self._vectors[:self._size] @ query
+            in_scope = np.fromiter((s == scope for s in self._scopes[:self._size]), dtype=bool, count=self._size)
+            scores[~in_scope] = -1.0
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if similarity < self.threshold:
+                metrics.incr("semantic_cache.misses")
+                return None
+            self._last_used[best] = time.time()
+            entry = self._entries[best]
+        entry['hits'] += 1
+        metrics.incr("semantic_cache.hits")
+        metrics.observe("semantic_cache.hit_similarity", round(similarity, 4))
+        return entry['reply'], best, similarity
+
+    def add(self, client_sequence, history, prompt_id, reply):
+        if not reply or not self.cacheable(client_sequence, history):
+            return
+        vector = self._vectorizer.embed(client_sequence)
+        scope = context_fingerprint(client_sequence)
+        with self._lock:
+            self._reset_for_prompt(prompt_id)
+            if self._size < self.max_entries:
+                index = self._size
+                self._size += 1
+            else:
+                index = int(np.argmin(self._last_used))
+                metrics.incr("semantic_cache.evictions")
+            self._vectors[index] = vector
+            self._scopes[index] = scope
+            self._entries[index] = {"client_sequence": client_sequence, "reply": reply, "hits": 0}
+            self._last_used[index] = time.time()
+        metrics.set_gauge("semantic_cache.size", self._size)
+
+    def submit_audit(self, index, cached_reply, generate_fn):
+        """
+        For a share of hits, regenerates the reply in the background and checks it
+        against the cached one. Never blocks the request thread.
+        """
+        if random.random() >= self.audit_rate or not self._audit_slots.acquire(blocking=False):
+            return False
+        self._audit_executor.submit(self._run_audit, index, cached_reply, generate_fn)
+        return True
+
+    def _run_audit(self, index, cached_reply, generate_fn):
+        try:
+            self.audit(index, cached_reply, generate_fn())
+        except Exception as e:
+            metrics.incr("semantic_cache.audit_errors")
+            print(f"Semantic cache audit failed: {e}")
+        finally:
+            self._audit_slots.release()
+
+    def audit(self, index, cached_reply, fresh_reply):
+        """
+        Compares a served cache hit with a fresh generation. Returns True if the hit was acceptable.
+        """
+        metrics.incr("semantic_cache.audits")
+        agreement = text_similarity(cached_reply, fresh_reply)
+        metrics.observe("semantic_cache.audit_agreement", agreement)
+        if agreement >= self.audit_min_similarity:
+            return True
+        metrics.incr("semantic_cache.false_hits")
+        with self._lock:
+            entry = self._entries[index]
+            if entry is not None and entry['reply'] == cached_reply:
+                self._scopes[index] = None
+                self._last_used[index] = 0
+        return False
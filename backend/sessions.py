@@ -0,0 +1,218 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import metrics
+from prompting import format_history
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sessions.sqlite3')
+
+
+class Session:
+    """
+    Conversation state kept server-side: the raw turns ({"role", "message"})
+    and their Groq-formatted messages, which are extended one turn at a time.
+    """
+
+    def __init__(self, session_id, history=None, formatted=None, updated_at=None):
+        self.id = session_id
+        self.history = history if history is not None else []
+        self.formatted = formatted if formatted is not None else format_history(self.history)
+        # Total turns ever appended (the SQLite store's sequence number); trimming doesn't reset it
+        self.turn_count = len(self.history)
+        self.updated_at = updated_at or time.time()
+
+    def add_turn(self, role, message):
+        turn = {"role": role, "message": message}
+        self.history.append(turn)
+        self.formatted.extend(format_history([turn]))
+        self.turn_count += 1
+        self.updated_at = time.time()
+
+    def trim(self, max_turns):
+        if len(self.history) > max_turns:
+            del self.history[:-max_turns]
+            del self.formatted[:-max_turns]
+
+
+class MemorySessionStore:
+    """
+    In-process LRU of sessions with a TTL. Sessions are lost on restart and are
+    not shared between worker processes (use the SQLite store for that).
+    """
+
+    def __init__(self, ttl=3600, max_sessions=10000, max_turns=200):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, history=None):
+        session = Session(uuid.uuid4().hex, [dict(turn) for turn in history or [] if isinstance(turn, dict)])
+        session.trim(self.max_turns)
+        with self._lock:
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                metrics.incr("sessions.evicted")
+            metrics.set_gauge("sessions.active", len(self._sessions))
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if time.time() - session.updated_at > self.ttl:
+                del self._sessions[session_id]
+                metrics.incr("sessions.expired")
+                return None
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def add_turn(self, session_id, role, message):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            session.add_turn(role, message)
+            session.trim(self.max_turns)
+            self._sessions.move_to_end(session_id)
+            return session
+
+
+class SqliteSessionStore:
+    """
+    SQLite-backed sessions, shared by every worker on the host. Turns are
+    appended as rows; each process keeps the formatted messages it has already
+    loaded and only reads turns added since (by itself or another worker).
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, ttl=3600, max_sessions=10000, max_turns=200):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, turn_count INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_turns ("
+            "session_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, message TEXT NOT NULL, "
+            "PRIMARY KEY (session_id, seq))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_idx ON sessions (updated_at)")
+
+    def _purge(self):
+        now = time.time()
+        expired = self._conn.execute("SELECT id FROM sessions WHERE updated_at < ?", (now - self.ttl,)).fetchall()
+        overflow = self._conn.execute(
+            "SELECT id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?", (self.max_sessions,)
+        ).fetchall()
+        for (session_id,) in expired + overflow:
+            self._conn.execute("DELETE FROM session_turns WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._cache.pop(session_id, None)
+        if expired or overflow:
+            metrics.incr("sessions.expired", len(expired))
+            metrics.incr("sessions.evicted", len(overflow))
+
+    def _remember(self, session):
+        self._cache[session.id] = session
+        self._cache.move_to_end(session.id)
+        while len(self._cache) > self.max_sessions:
+            self._cache.popitem(last=False)
+
+    def create(self, history=None):
+        turns = [dict(turn) for turn in history or [] if isinstance(turn, dict)][-self.max_turns:]
+        session = Session(uuid.uuid4().hex, turns)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._purge()
+                self._conn.execute(
+                    "INSERT INTO sessions (id, turn_count, updated_at) VALUES (?, ?, ?)",
+                    (session.id, len(turns), session.updated_at)
+                )
+                self._conn.executemany(
+                    "INSERT INTO session_turns (session_id, seq, role, message) VALUES (?, ?, ?, ?)",
+                    [(session.id, seq, t.get('role', 'client'), t.get('message', t.get('content', ''))) for seq, t in enumerate(turns)]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._remember(session)
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            row = self._conn.execute("SELECT turn_count, updated_at FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None:
+                self._cache.pop(session_id, None)
+                return None
+            turn_count, updated_at = row
+            if time.time() - updated_at > self.ttl:
+                metrics.incr("sessions.expired")
+                return None
+
+            session = self._cache.get(session_id) or Session(session_id)
+            loaded = session.turn_count
+            if loaded != turn_count:
+                # Read only the turns this process has not seen yet
+                if loaded > turn_count:
+                    session, loaded = Session(session_id), 0
+                rows = self._conn.execute(
+                    "SELECT role, message FROM session_turns WHERE session_id = ? AND seq >= ? ORDER BY seq",
+                    (session_id, loaded)
+                ).fetchall()
+                for role, message in rows:
+                    session.add_turn(role, message)
+                session.turn_count = turn_count
+            session.updated_at = updated_at
+            session.trim(self.max_turns)
+            self._remember(session)
+            return session
+
+    def add_turn(self, session_id, role, message):
+        session = self.get(session_id)
+        if session is None:
+            return None
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                (seq,) = self._conn.execute("SELECT turn_count FROM sessions WHERE id = ?", (session_id,)).fetchone()
+                self._conn.execute(
+                    "INSERT INTO session_turns (session_id, seq, role, message) VALUES (?, ?, ?, ?)",
+                    (session_id, seq, role, message)
+                )
+                self._conn.execute(
+                    "DELETE FROM session_turns WHERE session_id = ? AND seq < ?", (session_id, seq + 1 - self.max_turns)
+                )
+                self._conn.execute(
+                    "UPDATE sessions SET turn_count = ?, updated_at = ? WHERE id = ?", (seq + 1, time.time(), session_id)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if session.turn_count == seq:
+                session.add_turn(role, message)
+                session.trim(self.max_turns)
+        return session
+
+
+def create_session_store():
+    ttl = int(os.environ.get("SESSION_TTL_SECONDS", 3600))
+    max_sessions = int(os.environ.get("SESSION_MAX_COUNT", 10000))
+    max_turns = int(os.environ.get("SESSION_MAX_TURNS", 200))
+    if os.environ.get("SESSION_STORE", "memory") == "sqlite":
+        return SqliteSessionStore(os.environ.get("SESSION_DB_PATH", DEFAULT_DB_PATH), ttl, max_sessions, max_turns)
+    return MemorySessionStore(ttl, max_sessions, max_turns)
@@ -0,0 +1,132 @@
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import ratelimit
+from similarity import text_similarity
+
+
+def summarize(rows, margin=0.02, min_samples=20):
+    """
+    Aggregates shadow_results rows for one candidate.
+    The candidate is non-inferior when, over samples that have a ground truth,
+    its mean similarity to the consultant is at most `margin` below the primary's.
+    """
+    scored = [r for r in rows if r.get('primary_score') is not None and r.get('shadow_score') is not None]
+    agreements = [r['agreement'] for r in rows if r.get('agreement') is not None]
+    summary = {
+        "samples": len(rows),
+        "scored_samples": len(scored),
+        "mean_agreement": round(sum(agreements) / len(agreements), 4) if agreements else None,
+        "mean_primary_score": None,
+        "mean_shadow_score": None,
+        "non_inferior": False,
+    }
+    if scored:
+        primary = sum(r['primary_score'] for r in scored) / len(scored)
+        shadow = sum(r['shadow_score'] for r in scored) / len(scored)
+        summary["mean_primary_score"] = round(primary, 4)
+        summary["mean_shadow_score"] = round(shadow, 4)
+        summary["non_inferior"] = len(scored) >= min_samples and shadow >= primary - margin
+    return summary
+
+
+class ShadowRunner:
+    """
+    Replays a share of live traffic against the candidate prompt on a small
+    background pool. submit() never blocks: when every slot is busy the sample
+    is dropped instead of queueing behind the request thread.
+    generate_fn(client_sequence, history, prompt, contact_id, ground_truth) must
+    hold the ground truth out of the candidate's inputs, like the primary's.
+    """
+
+    def __init__(self, generate_fn, fetch_candidate_fn, store_fn, sample_rate=0.1,
+                 max_in_flight=4, workers=2, candidate_ttl=30):
+        self._generate = generate_fn
+        self._fetch_candidate = fetch_candidate_fn
+        self._store = store_fn
+        self.sample_rate = sample_rate
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shadow")
+        self._candidate_ttl = candidate_ttl
+        self._candidate = None
+        self._candidate_fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, generate_fn, fetch_candidate_fn, store_fn):
+        return cls(
+            generate_fn,
+            fetch_candidate_fn,
+            store_fn,
+            sample_rate=float(os.environ.get("SHADOW_SAMPLE_RATE", 0.1)),
+            max_in_flight=int(os.environ.get("SHADOW_MAX_IN_FLIGHT", 4)),
+            workers=int(os.environ.get("SHADOW_WORKERS", 2)),
+        )
+
+    def invalidate(self):
+        """
+        Forgets the cached candidate (called when a candidate is created or promoted).
+        """
+        with self._lock:
+            self._candidate_fetched_at = 0.0
+
+    def _current_candidate(self):
+        with self._lock:
+            if time.time() - self._candidate_fetched_at < self._candidate_ttl:
+                return self._candidate
+        candidate = self._fetch_candidate()
+        with self._lock:
+            self._candidate = candidate
+            self._candidate_fetched_at = time.time()
+        return candidate
+
+    def submit(self, client_sequence, history, primary_reply, primary_prompt_id,
+               primary_latency_ms=None, ground_truth=None, contact_id=None):
+        if ground_truth is None and random.random() >= self.sample_rate:
+            return False
+        if not self._slots.acquire(blocking=False):
+            metrics.incr("shadow.dropped")
+            return False
+        self._executor.submit(self._run, client_sequence, history, primary_reply,
+                              primary_prompt_id, primary_latency_ms, ground_truth, contact_id)
+        return True
+
+    def _run(self, client_sequence, history, primary_reply, primary_prompt_id, primary_latency_ms,
+             ground_truth, contact_id):
+        try:
+            candidate = self._current_candidate()
+            if not candidate or candidate['id'] == primary_prompt_id:
+                return
+
+            start = time.time()
+            # Shadow replays are background work: never take quota from live chat
+            with ratelimit.priority("batch"):
+                shadow_reply = self._generate(client_sequence, history, candidate['prompt_text'], contact_id, ground_truth)
+            shadow_latency_ms = int((time.time() - start) * 1000)
+
+            row = {
+                'candidate_prompt_id': candidate['id'],
+                'primary_prompt_id': primary_prompt_id,
+                'client_message': client_sequence,
+                'primary_reply': primary_reply,
+                'shadow_reply': shadow_reply,
+                'ground_truth': ground_truth,
+                'agreement': text_similarity(primary_reply, shadow_reply),
+                'primary_score': text_similarity(primary_reply, ground_truth) if ground_truth else None,
+                'shadow_score': text_similarity(shadow_reply, ground_truth) if ground_truth else None,
+                'primary_latency_ms': primary_latency_ms,
+                'shadow_latency_ms': shadow_latency_ms,
+            }
+            self._store(row)
+            metrics.incr("shadow.completed")
+            metrics.observe("shadow.agreement", row['agreement'])
+            metrics.observe("shadow.latency_ms", shadow_latency_ms)
+        except Exception as e:
+            metrics.incr("shadow.errors")
+            print(f"Shadow evaluation failed: {e}")
+        finally:
+            self._slots.release()
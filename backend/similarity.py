@@ -0,0 +1,19 @@
+import re
+from difflib import SequenceMatcher
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def text_similarity(a, b):
+    """
+    Cheap 0..1 similarity between two replies: the average of the character-level
+    SequenceMatcher ratio and the Jaccard overlap of their word sets.
+    """
+    if not a or not b:
+        return 0.0
+    a, b = a.lower(), b.lower()
+    char_ratio = SequenceMatcher(None, a, b).ratio()
+    words_a, words_b = set(_WORD_RE.findall(a)), set(_WORD_RE.findall(b))
+    union = words_a | words_b
+    jaccard = len(words_a & words_b) / len(union) if union else 0.0
+    return round((char_ratio + jaccard) / 2, 4)
@@ -0,0 +1,79 @@
+import json
+import hashlib
+import threading
+
+import metrics
+import deadlines
+
+
+def request_key(*parts):
+    """
+    Stable hash of JSON-serialisable request parts (model, messages, params).
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one: the first caller
+    (leader) runs fn, everyone arriving while it is in flight waits for and
+    shares its result or exception. Nothing is cached once the call returns.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+
+            if leader:
+                return self._lead(key, call, fn)
+
+            metrics.incr(f"singleflight.{self.name}.shared")
+            self._wait(call)
+            if isinstance(call.error, deadlines.RequestCancelled):
+                # The leader's request was cancelled, not ours: try again ourselves
+                metrics.incr(f"singleflight.{self.name}.retried")
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+    def _lead(self, key, call, fn):
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+            metrics.incr(f"singleflight.{self.name}.calls")
+
+    def _wait(self, call):
+        """
+        Waits for the leader while still honouring this request's own deadline/disconnect.
+        """
+        context = deadlines.current()
+        if context is None:
+            call.done.wait()
+            return
+        while not call.done.wait(0.05):
+            context.check()
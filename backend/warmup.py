@@ -0,0 +1,71 @@
+import os
+import time
+import threading
+
+import httpx
+
+import metrics
+
+
+def pool_limits():
+    """
+    Keep-alive pool settings shared by the Groq and Supabase HTTP clients.
+    """
+    return httpx.Limits(
+        max_connections=int(os.environ.get("HTTP_POOL_MAX_CONNECTIONS", 20)),
+        max_keepalive_connections=int(os.environ.get("HTTP_POOL_MAX_KEEPALIVE", 10)),
+        keepalive_expiry=float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", 120)),
+    )
+
+
+class WarmUp:
+    """
+    Runs named warm-up steps on a background thread, retrying failed ones, and
+    reports ready once every step has succeeded. Steps are plain callables that
+    raise on failure.
+    """
+
+    def __init__(self, steps, retry_interval=5.0):
+        self._steps = steps
+        self._retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self.checks = {name: {"ok": False, "error": None, "ms": None} for name, _ in steps}
+        self.started_at = None
+        self.ready_at = None
+
+    def start(self):
+        self.started_at = time.time()
+        threading.Thread(target=self._run, name="warmup", daemon=True).start()
+
+    def _run(self):
+        pending = list(self._steps)
+        while pending:
+            failed = []
+            for name, step in pending:
+                start = time.time()
+                try:
+                    step()
+                    result = {"ok": True, "error": None, "ms": int((time.time() - start) * 1000)}
+                    metrics.observe(f"warmup.{name}_ms", result["ms"])
+                except Exception as e:
+                    result = {"ok": False, "error": str(e), "ms": None}
+                    metrics.incr(f"warmup.{name}_failures")
+                    print(f"Warm-up step '{name}' failed, retrying in {self._retry_interval}s: {e}")
+                    failed.append((name, step))
+                with self._lock:
+                    self.checks[name] = result
+            pending = failed
+            if pending:
+                time.sleep(self._retry_interval)
+
+        with self._lock:
+            self.ready_at = time.time()
+        metrics.observe("warmup.total_ms", int((self.ready_at - self.started_at) * 1000))
+
+    def status(self):
+        with self._lock:
+            return {
+                "ready": self.ready_at is not None,
+                "checks": {name: dict(check) for name, check in self.checks.items()},
+                "warmup_ms": int((self.ready_at - self.started_at) * 1000) if self.ready_at else None,
+            }
@@ -0,0 +1,181 @@
+"""
+Micro-benchmarks for the Python hot paths (no network, no LLM calls).
+
+Usage:
+    python benchmarks/bench_hot_paths.py                      # default sizes
+    python benchmarks/bench_hot_paths.py --sizes 10,1000,1000000
+    python benchmarks/bench_hot_paths.py --compare benchmarks/results/<commit>.json
+
+Results are written to benchmarks/results/<commit>.json so runs on
+different commits can be compared with --compare.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BASE_DIR, 'benchmarks', 'results')
+
+sys.path.append(os.path.join(BASE_DIR, 'backend'))
+sys.path.append(os.path.join(BASE_DIR, 'scripts'))
+sys.path.append(os.path.join(BASE_DIR, 'benchmarks'))
+
+from prompting import format_history, parse_reply, build_messages, RULES_MARKER
+from optimization import extract_prompt_from_markdown, format_history_text
+from utils import load_data
+from parse_conversations import parse_conversations
+from synthetic_corpus import generate
+
+# A prompt version shaped like ours: ~8KB static core, then 50 learned rules
+PROMPT = (
+    "# Immigration Consultant Chatbot - System Prompt\n"
+    + "- A line of static service details and communication style guidance.\n" * 120
+    + f"{RULES_MARKER}\nBelow the line, more specific rules will be added as the model learns.\n---\n"
+    + "".join(f"- Learned rule number {i} about a specific scenario.\n" for i in range(50))
+)
+
+# Response shapes seen from the model, one per branch of the parsing fallback chain
+RESPONSES = {
+    "reply": json.dumps({"reply": "Processing in Singapore typically takes 7-10 business days."}),
+    "alt_key": json.dumps({"response": "Processing in Singapore typically takes 7-10 business days."}),
+    "single_key": json.dumps({"answer": "Processing in Singapore typically takes 7-10 business days."}),
+    "multi_key": json.dumps({"greeting": "Hi!", "body": "Processing takes 7-10 business days.", "cta": "Upload docs"}),
+    "plain_text": "Processing in Singapore typically takes 7-10 business days.",
+}
+
+
+def measure(fn, min_time=0.2, repeat=5):
+    """
+    timeit-style: calibrate the loop count to run at least `min_time`, then
+    repeat and report the best and median time per call.
+    """
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1 << 20:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+
+    timings = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        timings.append((time.perf_counter() - start) / loops)
+    return {
+        "loops": loops,
+        "best_us": round(min(timings) * 1e6, 3),
+        "median_us": round(statistics.median(timings) * 1e6, 3),
+    }
+
+
+def history_from_corpus(conversations, turns, as_dicts=True):
+    history = []
+    for conv in conversations:
+        for msg in conv['conversation']:
+            if as_dicts:
+                role = 'client' if msg['direction'] == 'in' else 'consultant'
+                history.append({"role": role, "message": msg['text']})
+            else:
+                history.append(("Client: " if msg['direction'] == 'in' else "Consultant: ") + msg['text'])
+            if len(history) == turns:
+                return history
+    return history
+
+
+def run(sizes, min_time):
+    results = []
+
+    def record(name, size, fn):
+        stats = measure(fn, min_time=min_time)
+        stats.update({"name": name, "size": size})
+        results.append(stats)
+        print(f"{name:<36} size={size:<9} best={stats['best_us']:>14.3f}us  median={stats['median_us']:>14.3f}us")
+
+    for name, content in RESPONSES.items():
+        record(f"parse_reply.{name}", 1, lambda content=content: parse_reply(content))
+
+    fenced = "```markdown\n- When mentioning fees, explicitly state they are payable only after document approval.\n```"
+    record("extract_prompt_from_markdown.fenced", 1, lambda: extract_prompt_from_markdown(fenced))
+    record("extract_prompt_from_markdown.plain", 1, lambda: extract_prompt_from_markdown(fenced.strip('`')))
+
+    for size in sizes:
+        print(f"-- corpus of {size} messages")
+        conversations = generate(size)
+        dict_history = history_from_corpus(conversations, size)
+        string_history = history_from_corpus(conversations, size, as_dicts=False)
+
+        record("format_history", size, lambda: format_history(dict_history))
+        formatted = format_history(dict_history)
+        record("build_messages", size, lambda: build_messages(PROMPT, formatted, "How long does processing take?"))
+        record("format_history_text.dicts", size, lambda: format_history_text(dict_history))
+        record("format_history_text.strings", size, lambda: format_history_text(string_history))
+        record("parse_conversations", size, lambda: parse_conversations(conversations))
+
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False, encoding='utf-8') as f:
+            json.dump(conversations, f)
+            data_file = f.name
+        try:
+            record("load_data", size, lambda: load_data(data_file))
+        finally:
+            os.remove(data_file)
+
+    return results
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(r['name'], r['size']): r for r in json.load(f)['results']}
+    print(f"\nComparison against {baseline_path} (ratio < 1.0 is faster):")
+    for r in results:
+        base = baseline.get((r['name'], r['size']))
+        if base and base['best_us']:
+            print(f"{r['name']:<36} size={r['size']:<9} {r['best_us'] / base['best_us']:.3f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Python hot paths")
+    parser.add_argument("--sizes", default="10,1000,100000", help="Comma-separated corpus sizes in messages")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per measurement")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    results = run(sizes, args.min_time)
+
+    commit = current_commit()
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            "commit": commit,
+            "timestamp": int(time.time()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results
+        }, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
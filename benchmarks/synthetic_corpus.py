@@ -0,0 +1,93 @@
+"""
+Synthetic conversation generator following the backend/conversations.json schema.
+
+Message texts are sampled from the real conversations (by direction) so message
+sizes stay realistic, while the number of messages scales from 10 to 1M.
+
+Usage:
+    python benchmarks/synthetic_corpus.py --messages 100000 --output /tmp/conversations_100k.json
+"""
+import os
+import json
+import random
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_FILE = os.path.join(BASE_DIR, 'backend', 'conversations.json')
+
+START_TIMESTAMP = 1762500000000
+
+
+def load_texts(data_file=DATA_FILE):
+    """
+    Returns ({'in': [...], 'out': [...]}, [scenarios]) from the real conversations.
+    """
+    with open(data_file, 'r', encoding='utf-8') as f:
+        conversations = json.load(f)
+    texts = {'in': [], 'out': []}
+    scenarios = []
+    for conv in conversations:
+        scenarios.append(conv.get('scenario', ''))
+        for msg in conv.get('conversation', []):
+            texts[msg['direction']].append(msg['text'])
+    return texts, scenarios
+
+
+def iter_conversations(total_messages, seed=42, min_length=4, max_length=24, data_file=DATA_FILE):
+    """
+    Yields conversations until `total_messages` messages have been produced.
+    Clients sometimes send bursts of 2-3 messages, like the real data.
+    """
+    rng = random.Random(seed)
+    texts, scenarios = load_texts(data_file)
+    produced = 0
+    index = 0
+    while produced < total_messages:
+        index += 1
+        length = min(rng.randint(min_length, max_length), total_messages - produced)
+        messages = []
+        timestamp = START_TIMESTAMP + index * 86400000
+        direction = 'in'
+        while len(messages) < length:
+            burst = rng.choice((1, 1, 1, 2, 3)) if direction == 'in' else rng.choice((1, 1, 2))
+            for _ in range(min(burst, length - len(messages))):
+                timestamp += rng.randint(5000, 120000)
+                messages.append({
+                    "message_id": len(messages) + 1,
+                    "direction": direction,
+                    "text": rng.choice(texts[direction]),
+                    "timestamp": timestamp
+                })
+            direction = 'out' if direction == 'in' else 'in'
+        produced += len(messages)
+        yield {
+            "contact_id": f"SYNTH_BENCH_{index:07d}",
+            "scenario": rng.choice(scenarios),
+            "conversation": messages
+        }
+
+
+def generate(total_messages, seed=42, **kwargs):
+    return list(iter_conversations(total_messages, seed=seed, **kwargs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic conversations.json")
+    parser.add_argument("--messages", type=int, default=10000, help="Total number of messages (10 to 1M)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    # Streamed so 1M messages don't need the whole corpus in memory
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.write("[\n")
+        for i, conv in enumerate(iter_conversations(args.messages, seed=args.seed)):
+            if i:
+                f.write(",\n")
+            json.dump(conv, f, ensure_ascii=False)
+        f.write("\n]\n")
+    print(f"Wrote {args.messages} messages to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,8 @@ export default function Home() {
   const [input, setInput] = useState('');
   const [isLoading, setIsLoading] = useState(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  const abortRef = useRef<AbortController | null>(null);
+  const sessionIdRef = useRef<string | null>(null);
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -21,6 +23,11 @@ export default function Home() {
     scrollToBottom();
   }, [messages]);
 
+  // Abort any in-flight reply when the chat is closed so the backend can stop generating it
+  useEffect(() => {
+    return () => abortRef.current?.abort();
+  }, []);
+
   const handleSend = async (e: React.FormEvent) => {
     e.preventDefault();
     if (!input.trim() || isLoading) return;
@@ -36,16 +43,44 @@ export default function Home() {
       if (!backendUrl) {
         throw new Error("Backend URL is not defined. Please restart your dev server.");
       }
-      console.log('Sending request to:', `${backendUrl}/generate-reply`);
-
-      const response = await fetch(`${backendUrl}/generate-reply`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          clientSequence: userMessage,
-          chatHistory: messages
-        }),
-      });
+      const headers = { 'Content-Type': 'application/json', 'X-Request-Timeout': '60' };
+      abortRef.current = new AbortController();
+      const signal = abortRef.current.signal;
+
+      // The backend keeps the history: create a session (seeded with what we have) once,
+      // then send only the new message and the reply we displayed
+      const ensureSession = async () => {
+        if (sessionIdRef.current) return sessionIdRef.current;
+        const res = await fetch(`${backendUrl}/sessions`, {
+          method: 'POST',
+          headers,
+          signal,
+          body: JSON.stringify({ chatHistory: messages }),
+        });
+        if (!res.ok) {
+          throw new Error(`HTTP error! status: ${res.status}`);
+        }
+        sessionIdRef.current = (await res.json()).sessionId;
+        return sessionIdRef.current;
+      };
+
+      const sendMessage = async () => {
+        const sessionId = await ensureSession();
+        console.log('Sending request to:', `${backendUrl}/sessions/${sessionId}/messages`);
+        return fetch(`${backendUrl}/sessions/${sessionId}/messages`, {
+          method: 'POST',
+          headers,
+          signal,
+          body: JSON.stringify({ clientSequence: userMessage }),
+        });
+      };
+
+      let response = await sendMessage();
+      if (response.status === 404) {
+        // Session expired: start a new one from our local history
+        sessionIdRef.current = null;
+        response = await sendMessage();
+      }
 
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
@@ -54,8 +89,14 @@ export default function Home() {
       const data = await response.json();
       if (data.aiReply) {
         setMessages([...newMessages, { role: 'consultant', message: data.aiReply }]);
+        await fetch(`${backendUrl}/sessions/${sessionIdRef.current}/reply`, {
+          method: 'POST',
+          headers,
+          body: JSON.stringify({ consultantReply: data.aiReply }),
+        });
       }
     } catch (error) {
+      if (error instanceof DOMException && error.name === 'AbortError') return;
       console.error('Fetch Error:', error);
       alert(`Connection Error: ${error instanceof Error ? error.message : String(error)}`);
     } finally {
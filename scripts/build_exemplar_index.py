@@ -0,0 +1,30 @@
+import os
+import sys
+import argparse
+
+# Ensure backend directory is in path for imports
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from utils import load_data
+from exemplars import build_index, DEFAULT_INDEX_DIR
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the few-shot exemplar index from real consultant conversations")
+    parser.add_argument("--data-file", help="Conversations file (default: backend/conversations.json)")
+    parser.add_argument("--output", default=DEFAULT_INDEX_DIR, help="Index directory (default: backend/exemplar_index)")
+    parser.add_argument("--dim", type=int, default=2048, help="Embedding dimensions")
+    args = parser.parse_args()
+
+    print("Loading data...")
+    data = load_data(args.data_file)
+    if not data:
+        print("No data found.")
+        return
+
+    count = build_index(data, args.output, dim=args.dim)
+    print(f"Indexed {count} exemplars in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import os
+import sys
+import random
+import argparse
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Ensure backend directory is in path for imports
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+# Load environment variables explicitly
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend', '.env'))
+
+from utils import load_data
+from prompting import build_messages, parse_reply
+from similarity import text_similarity
+from singleflight import request_key
+from evalcache import EvalCache, prompt_hash
+from llm import create_client, chat_completion, model_for
+from exemplars import ExemplarIndex
+from client_state import ClientStateTracker
+import ratelimit
+
+# Deterministic generation so cached predictions stay representative of the prompt
+EVAL_PARAMS = {
+    "temperature": 0,
+    "max_tokens": 500,
+    "response_format": {"type": "json_object"},
+}
+
+
+def history_to_messages(history):
+    """
+    load_data() history strings ("Client: ...", "Consultant: ...") as chat messages.
+    """
+    messages = []
+    for h in history:
+        if h.startswith("Client: "):
+            messages.append({"role": "user", "content": h[8:].strip()})
+        elif h.startswith("Consultant: "):
+            messages.append({"role": "assistant", "content": h[12:].strip()})
+    return messages
+
+
+def sample_messages(prompt, sample, exemplar_index, state_tracker):
+    """
+    Messages in the layout the app sends: held-out exemplars and the client state
+    block of long conversations (regex extraction only, no LLM fallback).
+    """
+    history = history_to_messages(sample['history'])
+    exemplars = None
+    if exemplar_index:
+        exemplars = exemplar_index.nearest(sample['client_input'], sample['history'],
+                                           exclude_contact=sample['contact_id'], exclude_reply=sample['consultant_response'])
+    state_block = None
+    if state_tracker:
+        state_block, history = state_tracker.compact(sample['history'], history)
+    return build_messages(prompt, history, sample['client_input'], exemplars=exemplars, client_state=state_block)
+
+
+def load_prompt(args):
+    if args.prompt_file:
+        with open(args.prompt_file, 'r', encoding='utf-8') as f:
+            return f.read()
+    from app import get_latest_prompt
+    return get_latest_prompt()
+
+
+def run(args, cache):
+    ratelimit.set_priority("batch")
+    prompt = load_prompt(args)
+    data = load_data(args.data_file)
+    if not data:
+        print("No data found.")
+        return
+
+    samples = random.Random(args.seed).sample(data, min(args.samples, len(data)))
+    exemplar_index = ExemplarIndex.from_env()
+    state_tracker = ClientStateTracker.from_env() if os.environ.get("CLIENT_STATE", "1") == "1" else None
+    model = model_for(args.tier)
+    client = None
+    hits = 0
+    scores = []
+
+    for i, sample in enumerate(samples):
+        messages = sample_messages(prompt, sample, exemplar_index, state_tracker)
+        key = request_key(model, messages, EVAL_PARAMS)
+
+        cached = None if args.refresh else cache.get(key)
+        if cached is not None:
+            hits += 1
+            prediction, score = cached['prediction'], cached['score']
+        else:
+            if client is None:
+                client = create_client()
+            completion = chat_completion(client, messages, tier=args.tier, **EVAL_PARAMS)
+            prediction, _ = parse_reply(completion.choices[0].message.content.strip())
+            score = text_similarity(prediction, sample['consultant_response'])
+            cache.put(key, prompt_hash(messages), model, prediction, score)
+
+        scores.append(score)
+        if args.verbose:
+            print(f"[{i + 1}/{len(samples)}] {'cached' if cached else 'ran'} score={score:.3f} {sample['client_input'][:50]!r}")
+
+    print(f"Samples: {len(samples)} (cached: {hits}, ran: {len(samples) - hits})")
+    print(f"Model: {model}")
+    print(f"Mean similarity to consultant: {sum(scores) / len(scores):.4f}")
+
+
+def show_stats(cache):
+    rows = cache.stats()
+    if not rows:
+        print("Evaluation cache is empty.")
+        return
+    for r in rows:
+        last_used = datetime.fromtimestamp(r['last_used_at']).strftime('%Y-%m-%d %H:%M')
+        print(f"{r['prompt_hash']}  {r['model']:<28} samples={r['samples']:<5} mean={r['mean_score']}  last used {last_used}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate a prompt version against recorded consultant replies")
+    parser.add_argument("--cache", help="Evaluation cache file (default: EVAL_CACHE_PATH or backend/eval_cache.sqlite3)")
+    commands = parser.add_subparsers(dest="command")
+
+    run_parser = commands.add_parser("run", help="Score a prompt, reusing cached predictions")
+    run_parser.add_argument("--prompt-file", help="Prompt text to evaluate (default: the active prompt)")
+    run_parser.add_argument("--data-file", help="Conversations file (default: backend/conversations.json)")
+    run_parser.add_argument("--samples", type=int, default=50)
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--tier", choices=("small", "large"), default="small")
+    run_parser.add_argument("--refresh", action="store_true", help="Ignore cached predictions")
+    run_parser.add_argument("--verbose", action="store_true")
+
+    commands.add_parser("stats", help="List cached evaluations per effective prompt")
+
+    prune_parser = commands.add_parser("prune", help="Delete cached evaluations")
+    prune_parser.add_argument("--older-than-days", type=float)
+    prune_parser.add_argument("--prompt-hash")
+
+    args = parser.parse_args()
+    cache = EvalCache(args.cache)
+    try:
+        if args.command == "stats":
+            show_stats(cache)
+        elif args.command == "prune":
+            if args.older_than_days is None and args.prompt_hash is None:
+                parser.error("prune needs --older-than-days and/or --prompt-hash")
+            print(f"Deleted {cache.prune(args.older_than_days, args.prompt_hash)} cached evaluations.")
+        elif args.command == "run":
+            run(args, cache)
+        else:
+            parser.print_help()
+    finally:
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,6 @@ import os
 import json
 import random
 import sys
-from groq import Groq
 from dotenv import load_dotenv
 
 # Ensure backend directory is in path for imports
@@ -14,14 +13,14 @@ load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file_
 try:
     from app import get_latest_prompt, INITIAL_SYSTEM_PROMPT
     from utils import load_data
+    from llm import create_client, chat_completion
+    import ratelimit
 except ImportError as e:
     print(f"Error importing modules: {e}")
     sys.exit(1)
 
 # Initialize Groq client
-client = Groq(
-    api_key=os.environ.get("GROQ_API_KEY"),
-)
+client = create_client()
 
 def generate_ai_reply(history, client_input):
     # Fetch the latest prompt from DB (or fallback to initial if db fails/empty)
@@ -57,9 +56,10 @@ def generate_ai_reply(history, client_input):
     messages.append({"role": "system", "content": "IMPORTANT: You must respond in JSON format."})
 
     try:
-        completion = client.chat.completions.create(
-            model=os.environ.get("MODEL_NAME", "llama-3.1-8b-instant"),
-            messages=messages,
+        completion = chat_completion(
+            client,
+            messages,
+            tier="small",
             temperature=0.7,
             max_tokens=500,
             response_format={"type": "json_object"}
@@ -80,6 +80,7 @@ def generate_ai_reply(history, client_input):
         return f"Error: {str(e)}"
 
 def main():
+    ratelimit.set_priority("batch")
     print("Loading data...")
     data = load_data()
     if not data:
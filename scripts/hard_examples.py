@@ -0,0 +1,100 @@
+import os
+import time
+import random
+import sqlite3
+from collections import defaultdict
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend', 'training_scores.sqlite3')
+
+# Priority = (1 - last score) + bonuses; never-scored samples always come first
+UNSCORED_PRIORITY = 2.0
+STALE_VERSION_BONUS = 0.3
+AGE_BONUS_PER_DAY = 0.05
+MAX_AGE_BONUS = 0.3
+
+
+class HardExampleSampler:
+    """
+    Persistent per-sample score index for training. Samples the bot handles
+    badly, or that were last scored under an older prompt version, are picked
+    first, spread across scenarios so one scenario can't take the whole batch.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("TRAINING_SCORES_PATH", DEFAULT_PATH)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sample_scores (
+                sample_id TEXT PRIMARY KEY,
+                scenario TEXT,
+                score REAL NOT NULL,
+                prompt_version TEXT,
+                scored_at REAL NOT NULL,
+                times_trained INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.commit()
+
+    def record(self, sample, score, prompt_version, trained=False):
+        self._conn.execute("""
+            INSERT INTO sample_scores (sample_id, scenario, score, prompt_version, scored_at, times_trained)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(sample_id) DO UPDATE SET
+                scenario = excluded.scenario, score = excluded.score, prompt_version = excluded.prompt_version,
+                scored_at = excluded.scored_at, times_trained = times_trained + excluded.times_trained
+        """, (sample['sample_id'], sample.get('scenario'), score, str(prompt_version), time.time(), int(trained)))
+        self._conn.commit()
+
+    def _scores(self):
+        rows = self._conn.execute("SELECT sample_id, score, prompt_version, scored_at FROM sample_scores").fetchall()
+        return {r[0]: {"score": r[1], "prompt_version": r[2], "scored_at": r[3]} for r in rows}
+
+    def priority(self, entry, prompt_version, now=None):
+        if entry is None:
+            return UNSCORED_PRIORITY
+        now = now or time.time()
+        priority = 1.0 - entry['score']
+        if entry['prompt_version'] != str(prompt_version):
+            priority += STALE_VERSION_BONUS
+        priority += min(MAX_AGE_BONUS, (now - entry['scored_at']) / 86400 * AGE_BONUS_PER_DAY)
+        return priority
+
+    def choose(self, data, k, prompt_version, rng=None):
+        """
+        Picks k samples: each scenario's candidates are sorted by priority, then
+        scenarios take turns (best head first) until the batch is full.
+        """
+        rng = rng or random.Random()
+        scores = self._scores()
+        now = time.time()
+        by_scenario = defaultdict(list)
+        for sample in data:
+            # Small jitter breaks ties so equal-priority samples rotate between runs
+            priority = self.priority(scores.get(sample['sample_id']), prompt_version, now) + rng.random() * 0.01
+            by_scenario[sample.get('scenario', '')].append((priority, sample))
+        for candidates in by_scenario.values():
+            candidates.sort(key=lambda item: item[0], reverse=True)
+
+        batch = []
+        queues = list(by_scenario.values())
+        while len(batch) < k and queues:
+            queues.sort(key=lambda queue: queue[0][0], reverse=True)
+            for queue in list(queues):
+                if len(batch) == k:
+                    break
+                batch.append(queue.pop(0))
+                if not queue:
+                    queues.remove(queue)
+        return [sample for _, sample in batch]
+
+    def summary(self):
+        """
+        Mean last score and sample count per scenario.
+        """
+        rows = self._conn.execute(
+            "SELECT scenario, COUNT(*), AVG(score), SUM(times_trained) FROM sample_scores GROUP BY scenario ORDER BY AVG(score)"
+        ).fetchall()
+        return [{"scenario": r[0], "samples": r[1], "mean_score": round(r[2], 4), "times_trained": r[3]} for r in rows]
+
+    def close(self):
+        self._conn.close()
@@ -2,7 +2,7 @@ import os
 import json
 import random
 import sys
-from groq import Groq
+import argparse
 from dotenv import load_dotenv
 
 # Ensure backend directory is in path for imports
@@ -12,28 +12,24 @@ sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__f
 env_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend', '.env')
 load_dotenv(env_path)
 
-from app import get_latest_prompt, supabase, generate_reply_logic
+from app import get_latest_prompt_record, supabase, generate_reply_logic
 from optimization import run_editor_optimization, extract_prompt_from_markdown
+from dedup import DuplicateRule
 from utils import load_data
+from hard_examples import HardExampleSampler
+from similarity import text_similarity
+from llm import create_client
+import ratelimit
 
 # Initialize Groq client
-client = Groq(
-    api_key=os.environ.get("GROQ_API_KEY"),
-)
+client = create_client()
 
-def main():
-    print("Loading data...")
-    data = load_data()
-    if not data:
-        print("No training data found.")
-        return
-
-    # Select a random sample for training
-    sample = random.choice(data)
-    print(f"Selected sample interaction: {sample['client_input'][:50]}...")
+def train_on_sample(sample, sampler, skip_above):
+    print(f"\nSelected sample interaction [{sample['scenario']}]: {sample['client_input'][:50]}...")
 
     # 1. Get current prompt
-    current_prompt = get_latest_prompt()
+    prompt_record = get_latest_prompt_record()
+    current_prompt = prompt_record['prompt_text']
     print("Current prompt loaded.")
 
     # 2. Generate Prediction
@@ -42,12 +38,21 @@ def main():
         # generate_reply_logic expects history as list of dicts (Groq format) or strings
         # parsed data has 'history' as list of strings ["Client: ...", "Consultant: ..."]
         # generate_reply_logic handles list of strings via format_history fallback
-        predicted_reply = generate_reply_logic(sample['client_input'], sample['history'])
+        # The sample's own conversation is held out of the few-shot exemplars
+        predicted_reply = generate_reply_logic(sample['client_input'], sample['history'], prompt=current_prompt,
+                                               exclude_contact=sample['contact_id'], ground_truth=sample['consultant_response'])
         print(f"Prediction: {predicted_reply[:100]}...")
     except Exception as e:
         print(f"Error generating prediction: {e}")
         return
 
+    score = text_similarity(predicted_reply, sample['consultant_response'])
+    sampler.record(sample, score, prompt_record['id'])
+    print(f"Similarity to consultant: {score:.3f}")
+    if score >= skip_above:
+        print("Already handled well, skipping the editor call.")
+        return
+
     # 3. Running Editor Optimization
     print("Running Editor Optimization...")
     try:
@@ -73,9 +78,13 @@ def main():
             
             # 5. Verify
             print("Verifying with new prompt...")
-            # Calling generate_reply_logic again pulls the latest active prompt from DB
-            new_prediction = generate_reply_logic(sample['client_input'], sample['history'])
+            new_record = get_latest_prompt_record()
+            new_prediction = generate_reply_logic(sample['client_input'], sample['history'], prompt=new_record['prompt_text'],
+                                                  exclude_contact=sample['contact_id'], ground_truth=sample['consultant_response'])
+            new_score = text_similarity(new_prediction, sample['consultant_response'])
+            sampler.record(sample, new_score, new_record['id'], trained=True)
             print(f"New Prediction: {new_prediction[:100]}...")
+            print(f"Similarity to consultant: {score:.3f} -> {new_score:.3f}")
             
         else:
             print("Optimization failed to produce a valid prompt.")
@@ -83,8 +92,37 @@ def main():
             print(f"RAW LLM OUTPUT:\n{optimization_result}")
             print("-" * 50)
 
+    except DuplicateRule as e:
+        print(f"Skipped: the new rule duplicates an existing one ({e.existing})")
     except Exception as e:
         print(f"Error during optimization: {e}")
 
+def main():
+    parser = argparse.ArgumentParser(description="Improve the prompt on the hardest training samples")
+    parser.add_argument("--batch-size", type=int, default=1, help="Samples to train on in this run")
+    parser.add_argument("--skip-above", type=float, default=0.8, help="Skip the editor when the prediction already scores this well")
+    parser.add_argument("--random", action="store_true", help="Pick samples uniformly at random instead")
+    args = parser.parse_args()
+
+    # Training runs are batch work: they must leave rate-limit headroom for live chat
+    ratelimit.set_priority("batch")
+    print("Loading data...")
+    data = load_data()
+    if not data:
+        print("No training data found.")
+        return
+
+    # Low-scoring and stale samples first, spread across scenarios
+    sampler = HardExampleSampler()
+    try:
+        if args.random:
+            batch = random.sample(data, min(args.batch_size, len(data)))
+        else:
+            batch = sampler.choose(data, args.batch_size, get_latest_prompt_record()['id'])
+        for sample in batch:
+            train_on_sample(sample, sampler, args.skip_above)
+    finally:
+        sampler.close()
+
 if __name__ == "__main__":
     main()
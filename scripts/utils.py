@@ -1,14 +1,16 @@
 import os
 import json
 
-def load_data():
+def load_data(data_file=None):
     """
-    Loads conversation data from backend/conversations.json.
-    Returns a list of dictionary objects with keys: history, client_input, consultant_response.
+    Loads conversation data from backend/conversations.json (or `data_file`).
+    Returns a list of dictionary objects with keys: history, client_input, consultant_response,
+    scenario, contact_id and sample_id (stable across runs: "<contact_id>:<turn index>").
     """
-    # Assuming scripts/utils.py is the location, backend is one level up
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    data_file = os.path.join(base_dir, 'backend', 'conversations.json')
+    if data_file is None:
+        # Assuming scripts/utils.py is the location, backend is one level up
+        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        data_file = os.path.join(base_dir, 'backend', 'conversations.json')
     
     if not os.path.exists(data_file):
         print(f"Data file not found: {data_file}")
@@ -22,8 +24,10 @@ def load_data():
         return []
     
     parsed_data = []
-    for conv in conversations:
+    for conv_index, conv in enumerate(conversations):
         messages = conv.get('conversation', [])
+        contact_id = conv.get('contact_id', f"conversation_{conv_index}")
+        scenario = conv.get('scenario', '')
         history = []
         i = 0
         while i < len(messages):
@@ -42,7 +46,10 @@ def load_data():
                     parsed_data.append({
                         'history': history.copy(),
                         'client_input': "\n".join(client_sequence),
-                        'consultant_response': "\n".join(consultant_sequence)
+                        'consultant_response': "\n".join(consultant_sequence),
+                        'scenario': scenario,
+                        'contact_id': contact_id,
+                        'sample_id': f"{contact_id}:{len(history)}"
                     })
                     for msg in client_sequence:
                          history.append(f"Client: {msg}")
@@ -26,3 +26,73 @@ CREATE TABLE IF NOT EXISTS conversation_logs (
     feedback_score INTEGER, -- 1-5 or similar
     feedback_text TEXT
 );
+
+-- Shadow evaluation: candidate prompt versions are scored on replayed live traffic before promotion
+ALTER TABLE prompts ADD COLUMN IF NOT EXISTS is_candidate BOOLEAN DEFAULT FALSE;
+
+CREATE TABLE IF NOT EXISTS shadow_results (
+    id SERIAL PRIMARY KEY,
+    candidate_prompt_id INTEGER REFERENCES prompts(id),
+    primary_prompt_id INTEGER REFERENCES prompts(id),
+    client_message TEXT,
+    primary_reply TEXT,
+    shadow_reply TEXT,
+    ground_truth TEXT, -- Consultant reply, when the request came from /improve-ai
+    agreement REAL, -- Similarity between primary and shadow replies
+    primary_score REAL, -- Similarity of the primary reply to the ground truth
+    shadow_score REAL, -- Similarity of the shadow reply to the ground truth
+    primary_latency_ms INTEGER,
+    shadow_latency_ms INTEGER,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS shadow_results_candidate_idx ON shadow_results (candidate_prompt_id);
+
+-- Analytics: reply logs and per prompt version / per hour rollups, updated incrementally on every write
+ALTER TABLE conversation_logs ADD COLUMN IF NOT EXISTS request_id TEXT UNIQUE; -- Returned to clients as logId for /feedback
+ALTER TABLE conversation_logs ADD COLUMN IF NOT EXISTS latency_ms INTEGER;
+ALTER TABLE conversation_logs ADD COLUMN IF NOT EXISTS similarity REAL; -- Similarity of bot_response to consultant_ground_truth
+ALTER TABLE conversation_logs ADD COLUMN IF NOT EXISTS source TEXT DEFAULT 'llm'; -- 'llm' or 'cache' (semantic cache hit)
+
+CREATE TABLE IF NOT EXISTS prompt_rollups (
+    prompt_id INTEGER NOT NULL, -- 0 = built-in fallback prompt
+    hour TIMESTAMP WITH TIME ZONE NOT NULL, -- 1970-01-01 holds the all-time totals
+    requests BIGINT NOT NULL DEFAULT 0,
+    latency_buckets JSONB NOT NULL DEFAULT '{}', -- Mergeable log-bucket sketch {bucket: count}
+    feedback_sum REAL NOT NULL DEFAULT 0,
+    feedback_count BIGINT NOT NULL DEFAULT 0,
+    similarity_sum REAL NOT NULL DEFAULT 0,
+    similarity_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (prompt_id, hour)
+);
+
+-- Atomically adds one observation to the hourly and the all-time row of a prompt version
+CREATE OR REPLACE FUNCTION record_prompt_rollup(
+    p_prompt_id INTEGER,
+    p_hour TIMESTAMP WITH TIME ZONE,
+    p_requests INTEGER,
+    p_latency_bucket INTEGER,
+    p_feedback REAL,
+    p_similarity REAL
+) RETURNS VOID AS $$
+DECLARE
+    bucket_hour TIMESTAMP WITH TIME ZONE;
+BEGIN
+    FOREACH bucket_hour IN ARRAY ARRAY[p_hour, 'epoch'::TIMESTAMP WITH TIME ZONE] LOOP
+        INSERT INTO prompt_rollups (prompt_id, hour) VALUES (COALESCE(p_prompt_id, 0), bucket_hour)
+        ON CONFLICT DO NOTHING;
+        UPDATE prompt_rollups SET
+            requests = requests + p_requests,
+            latency_buckets = CASE WHEN p_latency_bucket IS NULL THEN latency_buckets ELSE jsonb_set(
+                latency_buckets,
+                ARRAY[p_latency_bucket::TEXT],
+                to_jsonb(COALESCE((latency_buckets ->> p_latency_bucket::TEXT)::BIGINT, 0) + 1)
+            ) END,
+            feedback_sum = feedback_sum + COALESCE(p_feedback, 0),
+            feedback_count = feedback_count + (p_feedback IS NOT NULL)::INTEGER,
+            similarity_sum = similarity_sum + COALESCE(p_similarity, 0),
+            similarity_count = similarity_count + (p_similarity IS NOT NULL)::INTEGER
+        WHERE prompt_id = COALESCE(p_prompt_id, 0) AND hour = bucket_hour;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
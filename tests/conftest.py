@@ -0,0 +1,57 @@
+import os
+import sys
+import json
+import time
+
+import httpx
+import pytest
+from groq import Groq, DefaultHttpxClient
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import ratelimit
+
+
+def completion_body(content):
+    return {
+        "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "test",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6},
+    }
+
+
+class SlowBody(httpx.SyncByteStream):
+    def __init__(self, body, seen, delay):
+        self._body = body
+        self._seen = seen
+        self._delay = delay
+
+    def __iter__(self):
+        time.sleep(self._delay)
+        yield json.dumps(self._body).encode()
+
+    def close(self):
+        self._seen['closed'] = True
+
+
+def stub_client(reply="hi", seen=None, delay=0.0):
+    """
+    Real Groq client on a mock transport: every completion returns `reply`.
+    `seen` collects the sent request bodies, the timeout and whether the response was closed.
+    """
+    seen = {} if seen is None else seen
+    seen.setdefault('requests', [])
+
+    def handler(request):
+        seen['requests'].append(json.loads(request.content))
+        seen['timeout'] = request.extensions.get('timeout')
+        return httpx.Response(200, headers={"content-type": "application/json"},
+                              stream=SlowBody(completion_body(reply), seen, delay))
+    return Groq(api_key="test", http_client=DefaultHttpxClient(transport=httpx.MockTransport(handler)))
+
+
+@pytest.fixture(autouse=True)
+def isolated_limiter(tmp_path, monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_DB", str(tmp_path / "ratelimit.sqlite3"))
+    monkeypatch.setenv("LLM_SINGLE_FLIGHT", "0")
+    monkeypatch.setattr(ratelimit, "_limiter", None)
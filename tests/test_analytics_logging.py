@@ -0,0 +1,37 @@
+import os
+
+# The app module connects its clients at import time; point them at placeholders
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.test")
+os.environ.setdefault("LLM_CASSETTE_MODE", "replay")
+os.environ.setdefault("WARMUP_RETRY_SECONDS", "3600")
+
+import app
+
+
+class RecordingLogger:
+    def __init__(self):
+        self.calls = []
+
+    def log_reply(self, client_message, bot_response, prompt_id, latency_ms, **kwargs):
+        self.calls.append({"client_message": client_message, "bot_response": bot_response,
+                           "prompt_id": prompt_id, "latency_ms": latency_ms, **kwargs})
+        return "log-1"
+
+
+def test_cache_hits_are_logged_under_their_prompt_version(monkeypatch):
+    logger = RecordingLogger()
+    cache = app.SemanticCache(audit_rate=0.0)
+    cache.add("How much is your service fee?", [], 7, "Our fee is 18,000 THB.")
+    monkeypatch.setattr(app, "faq_matcher", None)
+    monkeypatch.setattr(app, "semantic_cache", cache)
+    monkeypatch.setattr(app, "conversation_logger", logger)
+    monkeypatch.setattr(app, "get_latest_prompt_record", lambda: {"id": 7, "prompt_text": "prompt"})
+
+    response = app.serve_reply("How much is your service fee?", [])
+
+    assert response == {"aiReply": "Our fee is 18,000 THB.", "source": "cache", "promptVersion": 7, "logId": "log-1"}
+    assert len(logger.calls) == 1
+    assert logger.calls[0]["prompt_id"] == 7
+    assert logger.calls[0]["source"] == "cache"
+    assert logger.calls[0]["latency_ms"] >= 0
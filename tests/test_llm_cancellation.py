@@ -0,0 +1,33 @@
+import time
+
+import pytest
+
+import llm
+import metrics
+import deadlines
+from conftest import stub_client
+
+
+def test_timeout_is_bounded_without_a_deadline(monkeypatch):
+    monkeypatch.setenv("LLM_TIMEOUT_SECONDS", "12")
+    seen = {}
+
+    completion = llm.chat_completion(stub_client(seen=seen), [{"role": "user", "content": "hello"}])
+
+    assert completion.choices[0].message.content == "hi"
+    assert seen['timeout']['read'] == 12.0
+
+
+def test_cancelled_call_closes_response_and_is_counted():
+    seen = {}
+    abandoned_before = metrics.get_counter("llm.abandoned")
+    token = deadlines.activate(deadlines.RequestContext(deadline=time.time() + 0.1))
+    try:
+        with pytest.raises(deadlines.RequestCancelled):
+            llm.chat_completion(stub_client(seen=seen, delay=0.3), [{"role": "user", "content": "hello"}])
+    finally:
+        deadlines.deactivate(token)
+
+    assert seen.get('closed') is True
+    assert metrics.get_counter("llm.abandoned") == abandoned_before + 1
+    assert seen['timeout']['read'] <= 0.1
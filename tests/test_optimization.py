@@ -0,0 +1,39 @@
+import pytest
+
+from dedup import DuplicateRule
+from prompting import RULES_MARKER
+from optimization import run_editor_optimization, run_manual_optimization
+from conftest import stub_client
+
+PROMPT = f"You are a visa consultant.\n\n{RULES_MARKER}\n- If a user asks about Singapore, mention processing takes 7-10 business days.\n"
+SAMPLE = {
+    "history": ["Client: Hi", "Consultant: Hello! How can I help?"],
+    "client_input": "How long does it take in Malaysia?",
+    "consultant_response": "Malaysia usually takes 10-14 business days.",
+}
+
+
+def test_editor_optimization_appends_rule():
+    rule = "If a user asks about Malaysia, mention processing takes 10-14 business days."
+    seen = {}
+
+    new_prompt = run_editor_optimization(stub_client(f"```markdown\n{rule}\n```", seen), PROMPT, SAMPLE, "It takes about a week.")
+
+    assert new_prompt == f"{PROMPT}- {rule}\n"
+    assert len(seen['requests']) == 1
+    assert "10-14 business days" in seen['requests'][0]["messages"][1]["content"]
+
+
+def test_editor_optimization_rejects_duplicate_rule():
+    client = stub_client("When users ask about Singapore, mention that processing takes 7-10 business days.")
+
+    with pytest.raises(DuplicateRule):
+        run_editor_optimization(client, PROMPT, SAMPLE, "It takes about a week.")
+
+
+def test_manual_optimization_can_skip_duplicate_check():
+    rule = "When users ask about Singapore, mention that processing takes 7-10 business days."
+
+    new_prompt = run_manual_optimization(stub_client(rule), PROMPT, "repeat the Singapore timing", check_duplicates=False)
+
+    assert new_prompt.endswith(f"- {rule}\n")
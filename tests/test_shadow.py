@@ -0,0 +1,17 @@
+from shadow import ShadowRunner
+
+
+def test_replay_holds_out_ground_truth():
+    calls, rows = [], []
+
+    def generate(client_sequence, history, prompt, contact_id, ground_truth):
+        calls.append((prompt, contact_id, ground_truth))
+        return "Processing takes 10-14 business days."
+
+    runner = ShadowRunner(generate, lambda: {"id": 2, "prompt_text": "candidate"}, rows.append, sample_rate=0.0)
+    assert runner.submit("How long in Malaysia?", [], "About a week.", 1,
+                         ground_truth="Malaysia takes 10-14 business days.", contact_id="c1")
+    runner._executor.shutdown(wait=True)
+
+    assert calls == [("candidate", "c1", "Malaysia takes 10-14 business days.")]
+    assert rows[0]['shadow_score'] is not None and rows[0]['primary_score'] is not None